@@ -0,0 +1,25 @@
+"""
+gunicorn settings, read automatically by `gunicorn run:app` when started from this folder.
+
+Defaults are gunicorn's own (sync workers, WEB_CONCURRENCY or 1 worker, 30 s timeout).
+Threaded workers are opt-in: GUNICORN_WORKER_CLASS=gthread GUNICORN_THREADS=8. Every
+thread has its own SQLite connection (db.get_conn), and each worker funnels its
+attendance writes through one group-commit thread (webapp/write_queue.py). Keep the
+worker count low and raise threads instead: all workers share one SQLite write lock.
+Measure with `python scripts/load_attendance.py --compare` before switching.
+"""
+import os
+
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "sync")
+workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+threads = int(os.environ.get("GUNICORN_THREADS", "1"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "30"))
+
+
+def on_starting(server):
+    # Migrate once in the master, before any worker is forked; the workers' own
+    # init_db at import then finds the schema current and returns at once
+    from webapp import db
+
+    db.init_db()
+    db.close_conn()
@@ -0,0 +1,187 @@
+"""
+Benchmark suite: builds a synthetic database (scripts/synthetic_data.py), then times
+every query function in webapp/db.py, the /, /attendance and /export pages through
+the Flask test client, and both export writers. Results go to JSON so runs can be
+compared; with --baseline the run fails when a timing regressed past the threshold.
+
+Usage:
+    python scripts/bench.py [--students 2000] [--days 100] [--subjects 4] [--repeat 5]
+                            [--only TEXT] [--output results.json]
+                            [--baseline results.json] [--threshold 0.25] [--min-ms 2]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import synthetic_data  # noqa: E402
+from webapp import create_app, db, metrics, report_cache  # noqa: E402
+from webapp.utils_export import rows_to_excel_file, rows_to_pdf_bytes  # noqa: E402
+
+WRITER_ROWS = 5000  # report rows fed to each export writer
+
+
+def _cases(scale: dict) -> List[Tuple[str, Callable[[], object]]]:
+    """(label, call) pairs; writes keep the data as it was so every repeat sees the same database."""
+    last = datetime.date.fromisoformat(scale["last_day"])
+    month = (last - datetime.timedelta(days=29), last)
+    stage, section, lab = synthetic_data.STAGES[0], synthetic_data.SECTIONS[0], synthetic_data.LABS[0]
+    subject = synthetic_data.SUBJECTS[0]
+    exam = "E000042"
+    student = synthetic_data.student_rows(43)[42][:5]  # id 43 is E000042
+    section_roll = db.get_students_by_stage_section(stage, section)["exam_number"].tolist()
+    roll_call = [(e, "present") for e in section_roll]
+    report_rows = list(db.iter_attendance_report_between_dates(*month))[:WRITER_ROWS]
+    page_key = db.get_attendance_report_page(*month, page_size=1)[1]
+    client = create_app().test_client()
+    query = f"start={month[0]}&end={month[1]}&stage={stage}"
+
+    def get(url: str) -> Callable[[], object]:
+        def call() -> None:
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f"GET {url} -> {response.status_code}")
+        return call
+
+    return [
+        # db.py reads
+        ("db.get_dashboard_counts", lambda: db.get_dashboard_counts(last)),
+        ("db.get_students", db.get_students),
+        ("db.search_students(name)", lambda: db.search_students(name_contains="محمد الجبوري", limit=50)),
+        ("db.search_students(exam)", lambda: db.search_students(exam_number=exam)),
+        ("db.get_student_id_by_exam", lambda: db.get_student_id_by_exam(exam)),
+        ("db.get_students_by_stage_section", lambda: db.get_students_by_stage_section(stage, section, lab)),
+        ("db.get_attendance_for_date_stage_section", lambda: db.get_attendance_for_date_stage_section(last, stage, section)),
+        ("db.get_attendance_statuses", lambda: db.get_attendance_statuses(last, stage, section, None, subject)),
+        ("db.get_attendance_by_student", lambda: db.get_attendance_by_student(exam)),
+        ("db.get_attendance_page_for_student", lambda: db.get_attendance_page_for_student(exam, page_size=50)),
+        ("db.autocomplete_students(name)", lambda: db.autocomplete_students("مح")),
+        ("db.autocomplete_students(exam)", lambda: db.autocomplete_students("E0001")),
+        ("db.get_attendance_report_between_dates(30d)", lambda: db.get_attendance_report_between_dates(*month)),
+        ("db.iter_attendance_report_between_dates(30d)", lambda: sum(1 for _ in db.iter_attendance_report_between_dates(*month))),
+        ("db.get_attendance_report_page(first)", lambda: db.get_attendance_report_page(*month, page_size=50)),
+        ("db.get_attendance_report_page(next)", lambda: db.get_attendance_report_page(*month, after=page_key, page_size=50)),
+        ("db.count_attendance_report(30d)", lambda: db.count_attendance_report(*month)),
+        ("db.get_attendance_matrix(30d, stage)", lambda: db.get_attendance_matrix(*month, stage)),
+        ("db.get_absence_rates(30d, student)", lambda: db.get_absence_rates(*month, by="student")),
+        ("db.get_absence_rates(30d, section)", lambda: db.get_absence_rates(*month, by="section")),
+        ("db.get_report_stamp", lambda: db.get_report_stamp(*month, stage)),
+        ("db.get_distinct_stages", db.get_distinct_stages),
+        ("db.get_sections_for_stage", lambda: db.get_sections_for_stage(stage)),
+        ("db.get_distinct_labs", db.get_distinct_labs),
+        ("db.get_students_filtered(stage)", lambda: db.get_students_filtered(stage=stage, section=section)),
+        ("db.get_students_filtered(name)", lambda: db.get_students_filtered(name_contains="فاطمة")),
+        ("db.find_active_export_job", lambda: db.find_active_export_job("0" * 64)),
+        # db.py writes, rewriting values that are already there
+        ("db.upsert_attendance_for_date", lambda: db.upsert_attendance_for_date(exam, last, "present", subject)),
+        ("db.upsert_attendance_bulk(section)", lambda: db.upsert_attendance_bulk(last, roll_call, subject)),
+        ("db.update_student", lambda: db.update_student(43, *student)),
+        # pages
+        ("GET /", get("/")),
+        ("GET /attendance", get(f"/attendance?date={last}&stage={stage}&section={section}&subject={subject}")),
+        ("GET /export", get(f"/export?{query}")),
+        ("GET /export?report=matrix", get(f"/export?{query}&report=matrix")),
+        # export writers
+        (f"rows_to_excel_file({len(report_rows)} rows)", lambda: rows_to_excel_file(db.REPORT_COLUMNS, report_rows).close()),
+        (f"rows_to_pdf_bytes({len(report_rows)} rows)", lambda: rows_to_pdf_bytes(db.REPORT_COLUMNS, report_rows, title="benchmark")),
+    ]
+
+
+def _time(call: Callable[[], object], repeat: int) -> Dict[str, float]:
+    call()  # warm caches and prepared statements
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        times.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": round(statistics.median(times), 3),
+        "min_ms": round(min(times), 3),
+        "max_ms": round(max(times), 3),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_ms: float) -> List[str]:
+    """
+    Labels whose median grew by more than `threshold` (0.25 = 25%) over the baseline and
+    by at least `min_ms`, so sub-millisecond noise never fails a run.
+    """
+    regressions = []
+    for label, now in results["results"].items():
+        before = baseline.get("results", {}).get(label)
+        if before is None:
+            continue
+        old, new = before["median_ms"], now["median_ms"]
+        if new > old * (1 + threshold) and new - old >= min_ms:
+            regressions.append(f"{label}: {old:.2f}ms -> {new:.2f}ms ({new / old - 1:+.0%})")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=100)
+    parser.add_argument("--subjects", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", help="run only the cases whose label contains this text")
+    parser.add_argument("--output", type=Path, help="write results to this JSON file")
+    parser.add_argument("--baseline", type=Path, help="JSON from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown before failing (0.25 = 25%%)")
+    parser.add_argument("--min-ms", type=float, default=2.0, help="ignore slowdowns smaller than this many ms")
+    args = parser.parse_args()
+
+    metrics.SLOW_QUERY_MS = float("inf")  # the timings are reported here; keep the slow-query log quiet
+    tmp = Path(tempfile.mkdtemp())
+    db.ARCHIVE_DIR = tmp / "archive"
+    report_cache.REPORT_CACHE_DIR = tmp / "report_cache"
+    start = time.perf_counter()
+    scale = synthetic_data.generate(tmp / "bench.db", args.students, args.days, args.subjects)
+    print(f"generated {scale['attendance_rows']} attendance rows in {time.perf_counter() - start:.1f}s")
+
+    results = {
+        "meta": {
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "repeat": args.repeat,
+            "scale": scale,
+        },
+        "results": {},
+    }
+    for label, call in _cases(scale):
+        if args.only and args.only not in label:
+            continue
+        timing = _time(call, args.repeat)
+        results["results"][label] = timing
+        print(f"{label:>48}: {timing['median_ms']:9.2f}ms  (min {timing['min_ms']:.2f}, max {timing['max_ms']:.2f})")
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"results written to {args.output}")
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        shape = ("students", "days", "subjects")
+        if any(baseline["meta"]["scale"].get(k) != scale[k] for k in shape):
+            print("warning: baseline was recorded at a different scale")
+        regressions = compare(results, baseline, args.threshold, args.min_ms)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        print(f"{len(regressions)} regression(s) against {args.baseline}" if regressions else "no regressions")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
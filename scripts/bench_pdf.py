@@ -0,0 +1,68 @@
+"""
+Benchmark Arabic shaping and PDF generation on a synthetic report.
+
+Usage: python scripts/bench_pdf.py [rows]   (default 10000)
+"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pandas as pd  # noqa: E402
+
+from webapp import utils_export  # noqa: E402
+from webapp.db import REPORT_COLUMNS  # noqa: E402
+
+STAGES = ["الأولى", "الثانية", "الثالثة", "الرابعة"]
+SUBJECTS = ["برمجة", "حساب التفاضل", "شبكات", "قواعد بيانات"]
+
+
+def synthetic_report(rows: int) -> pd.DataFrame:
+    return pd.DataFrame(
+        [
+            (
+                f"2025-01-{i % 28 + 1:02d}",
+                SUBJECTS[i % len(SUBJECTS)],
+                f"طالب رقم {i % 2000}",
+                f"E{i % 2000:05d}",
+                STAGES[i % len(STAGES)],
+                "أ" if i % 2 else "ب",
+                f"LAB{i % 4 + 1}",
+                "present" if i % 7 else "absent",
+            )
+            for i in range(rows)
+        ],
+        columns=REPORT_COLUMNS,
+    )
+
+
+def _time(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    df = synthetic_report(rows)
+    cells = [str(v) for v in df.values.ravel().tolist()]
+
+    # Uncached shaping is slow enough that a sample is timed and scaled up
+    sample = cells[: min(len(cells), 5000)]
+    uncached = _time(lambda: [utils_export._shape_cached.__wrapped__(c) for c in sample]) * len(cells) / len(sample)
+    utils_export._shape_cached.cache_clear()
+    cached = _time(lambda: [utils_export._shape_arabic(c) for c in cells])
+    print(f"shaping {len(cells)} cells: uncached ~{uncached:.2f}s, cached {cached:.2f}s ({uncached / cached:.1f}x)")
+
+    utils_export._ensure_arabic_font.cache_clear()
+    first = _time(utils_export._ensure_arabic_font)
+    again = _time(utils_export._ensure_arabic_font)
+    print(f"font discovery: first {first * 1000:.1f}ms, cached {again * 1000:.3f}ms ({utils_export._ensure_arabic_font()})")
+
+    total = _time(lambda: utils_export.dataframe_to_pdf_bytes(df, title="تقرير الحضور"))
+    print(f"dataframe_to_pdf_bytes({rows} rows): {total:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark student name search on a synthetic roster: FTS5 prefix search
+(search_students) against the old LIKE '%q%' scan.
+
+Usage: python scripts/bench_search.py [students]   (default 100000)
+"""
+import datetime
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from webapp import db  # noqa: E402
+
+FIRST = ["محمد", "أحمد", "علي", "حسين", "فاطمة", "زينب", "مريم", "إبراهيم", "عائشة", "مصطفى", "آمنة", "يوسف"]
+LAST = ["الجبوري", "العبيدي", "الموسوي", "الحسيني", "الربيعي", "التميمي", "الساعدي", "الزبيدي", "الخفاجي", "الدليمي"]
+QUERIES = ["محمد", "احمد الجب", "فاطمه", "ابراهيم التميمي", "يوسف الزبيدي", "امنه", "مُصطفى"]
+REPEAT = 20
+LIMIT = 50  # top-N, as the search page and autocomplete request
+
+
+def _seed(students: int) -> None:
+    now = datetime.datetime(2025, 1, 1).isoformat(timespec="seconds")
+    with db.get_conn() as conn:
+        conn.executemany(
+            "INSERT INTO students(name, exam_number, stage, section, lab, created_at) VALUES (?,?,?,?,?,?)",
+            [
+                (
+                    f"{FIRST[i % len(FIRST)]} {FIRST[i // len(FIRST) % len(FIRST)]} {LAST[i // 7 % len(LAST)]} {i}",
+                    f"E{i:06d}",
+                    f"st{i % 4}",
+                    "AB"[i % 2],
+                    f"LAB{i % 4 + 1}",
+                    now,
+                )
+                for i in range(students)
+            ],
+        )
+
+
+def _median_ms(fn) -> float:
+    times = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def _like(q: str) -> list:
+    with db.get_conn() as conn:
+        return conn.execute(
+            "SELECT id, name, exam_number, stage, section, lab FROM students WHERE name LIKE ? ORDER BY name",
+            (f"%{q}%",),
+        ).fetchall()
+
+
+def main() -> None:
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    db.DB_PATH = Path(os.path.join(tempfile.mkdtemp(), "search.db"))
+    db.init_db()
+    start = time.perf_counter()
+    _seed(students)
+    print(f"seeded {students} students (FTS kept in sync by triggers) in {time.perf_counter() - start:.1f}s")
+
+    for q in QUERIES:
+        hits = len(db.search_students(name_contains=q))
+        top = _median_ms(lambda: db.search_students(name_contains=q, limit=LIMIT))
+        full = _median_ms(lambda: db.search_students(name_contains=q))
+        like_hits = len(_like(q))
+        like = _median_ms(lambda: _like(q))
+        print(
+            f"{q!r:>22}: fts top {LIMIT} {top:6.2f}ms, all {full:7.2f}ms ({hits} rows)"
+            f"   like {like:7.2f}ms ({like_hits} rows)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Measure worker startup: the time and peak memory of `import run` (app creation plus
+init_db) in a fresh interpreter, and which heavy libraries it loaded. The first run
+creates the database; the rest start against an up-to-date one, like worker restarts.
+
+Usage: python scripts/bench_startup.py [--runs 7] [--output startup.json] [--baseline startup.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench import compare  # noqa: E402
+
+HEAVY = ("pandas", "numpy", "reportlab", "openpyxl", "xlsxwriter", "arabic_reshaper", "bidi", "pypdf")
+
+# Runs in the child: point the app at the temp database, then time the import
+CHILD = """
+import json, resource, sys, time
+from pathlib import Path
+start = time.perf_counter()
+from webapp import db
+db.DB_PATH = Path(sys.argv[1])
+import run
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "import_ms": elapsed * 1000,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "loaded": sorted(m for m in sys.argv[2].split(",") if m in sys.modules),
+}))
+"""
+
+
+def _run_child(db_path: Path) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, str(db_path), ",".join(HEAVY)],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--baseline", type=Path)
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--min-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    db_path = Path(tempfile.mkdtemp()) / "startup.db"
+    first = _run_child(db_path)
+    runs = [_run_child(db_path) for _ in range(args.runs)]
+    results = {
+        "meta": {"runs": args.runs, "python": sys.version.split()[0]},
+        "results": {
+            "import run (new database)": {"median_ms": round(first["import_ms"], 3)},
+            "import run": {
+                "median_ms": round(statistics.median(r["import_ms"] for r in runs), 3),
+                "min_ms": round(min(r["import_ms"] for r in runs), 3),
+                "max_ms": round(max(r["import_ms"] for r in runs), 3),
+            },
+        },
+        "max_rss_mb": round(statistics.median(r["max_rss_mb"] for r in runs), 1),
+        "loaded": runs[-1]["loaded"],
+    }
+    print(f"import run, new database: {first['import_ms']:8.1f}ms")
+    timing = results["results"]["import run"]
+    print(f"import run:               {timing['median_ms']:8.1f}ms  (min {timing['min_ms']:.1f}, max {timing['max_ms']:.1f})")
+    print(f"peak RSS:                 {results['max_rss_mb']:8.1f}MB")
+    print(f"heavy modules loaded:     {', '.join(results['loaded']) or 'none'}")
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text(encoding="utf-8")), args.threshold, args.min_ms)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        print(f"{len(regressions)} regression(s) against {args.baseline}" if regressions else "no regressions")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
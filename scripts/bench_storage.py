@@ -0,0 +1,146 @@
+"""
+Measure the compact attendance layout (migration 7) against the original one:
+builds a synthetic database at schema version 6, times the attendance queries,
+migrates it, and times them again. File sizes are taken after VACUUM.
+
+Usage: python scripts/bench_storage.py [students] [days]   (default 2000 250)
+"""
+import datetime
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pandas as pd  # noqa: E402
+
+from webapp import db  # noqa: E402
+
+START = datetime.date(2024, 9, 1)
+SUBJECTS = ["برمجة", "حساب التفاضل", "شبكات", "قواعد بيانات"]
+REPEAT = 5
+
+# The original queries, for the "before" timings, read the way the old functions returned them
+LEGACY = {
+    "report (30 days)": (
+        """
+        SELECT a.date, a.subject, s.name, s.exam_number, s.stage, s.section, s.lab, a.status
+        FROM attendance a JOIN students s ON s.id = a.student_id
+        WHERE a.date BETWEEN ? AND ? ORDER BY a.date, s.stage, s.section, s.lab, s.name
+        """,
+        lambda: (START.isoformat(), (START + datetime.timedelta(days=29)).isoformat()),
+        "frame",
+    ),
+    "count (whole range)": (
+        "SELECT COUNT(*) FROM attendance a JOIN students s ON s.id = a.student_id WHERE a.date BETWEEN ? AND ?",
+        lambda: (START.isoformat(), (START + datetime.timedelta(days=400)).isoformat()),
+        "rows",
+    ),
+    "student history": (
+        """
+        SELECT a.date, a.status, a.subject FROM attendance a JOIN students s ON s.id = a.student_id
+        WHERE s.exam_number = ? ORDER BY a.date DESC
+        """,
+        lambda: ("E00042",),
+        "dicts",
+    ),
+    "day sheet (stage)": (
+        """
+        SELECT a.date, a.status, a.subject, s.name, s.exam_number, s.stage, s.section, s.lab
+        FROM attendance a JOIN students s ON s.id = a.student_id
+        WHERE a.date = ? AND s.stage = ? ORDER BY s.stage, s.section, s.lab, s.name
+        """,
+        lambda: ((START + datetime.timedelta(days=10)).isoformat(), "st1"),
+        "frame",
+    ),
+}
+
+CURRENT = {
+    "report (30 days)": lambda: db.get_attendance_report_between_dates(START, START + datetime.timedelta(days=29)),
+    "count (whole range)": lambda: db.count_attendance_report(START, START + datetime.timedelta(days=400)),
+    "student history": lambda: db.get_attendance_by_student("E00042"),
+    "day sheet (stage)": lambda: db.get_attendance_for_date_stage_section(START + datetime.timedelta(days=10), "st1"),
+}
+
+
+def _seed(students: int, days: int) -> int:
+    conn = db.get_conn()
+    now = datetime.datetime(2024, 9, 1).isoformat(timespec="seconds")
+    with conn:
+        conn.executemany(
+            "INSERT INTO students(name, exam_number, stage, section, lab, created_at) VALUES (?,?,?,?,?,?)",
+            [(f"طالب {i}", f"E{i:05d}", f"st{i % 4}", "AB"[i % 2], f"LAB{i % 4 + 1}", now) for i in range(students)],
+        )
+        conn.executemany(
+            "INSERT INTO attendance(student_id, date, status, subject) VALUES (?,?,?,?)",
+            (
+                (
+                    sid,
+                    (START + datetime.timedelta(days=d)).isoformat(),
+                    "present" if (sid + d) % 6 else "absent",
+                    SUBJECTS[(sid + d) % len(SUBJECTS)],
+                )
+                for d in range(days)
+                for sid in range(1, students + 1)
+            ),
+        )
+    return students * days
+
+
+def _size() -> int:
+    conn = db.get_conn()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("VACUUM")
+    return os.path.getsize(db.DB_PATH)
+
+
+def _legacy_call(conn, sql: str, args: tuple, kind: str):
+    if kind == "frame":
+        return pd.read_sql_query(sql, conn, params=args)
+    rows = conn.execute(sql, args).fetchall()
+    return [dict(r) for r in rows] if kind == "dicts" else rows
+
+
+def _median_ms(fn) -> float:
+    times = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main() -> None:
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 250
+    db.DB_PATH = Path(os.path.join(tempfile.mkdtemp(), "storage.db"))
+    migrations = db.MIGRATIONS
+    db.MIGRATIONS = [m for m in migrations if m[0] < 7]
+    db.init_db()
+    rows = _seed(students, days)
+    conn = db.get_conn()
+    conn.execute("ANALYZE")
+
+    before_size = _size()
+    before = {
+        label: _median_ms(lambda: _legacy_call(conn, sql, args(), kind)) for label, (sql, args, kind) in LEGACY.items()
+    }
+
+    start = time.perf_counter()
+    db.MIGRATIONS = migrations
+    db._apply_migrations(conn)
+    migrate = time.perf_counter() - start
+    after_size = _size()
+    after = {label: _median_ms(fn) for label, fn in CURRENT.items()}
+
+    print(f"{rows} attendance rows, migration took {migrate:.1f}s")
+    print(f"file size: {before_size / 2**20:.1f} MB -> {after_size / 2**20:.1f} MB ({after_size / before_size:.0%})")
+    for label in LEGACY:
+        print(f"{label:>20}: {before[label]:8.2f}ms -> {after[label]:8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Run EXPLAIN QUERY PLAN on every query issued by the functions in webapp/db.py
+and fail if SQLite falls back to a full table scan or a temp B-tree sort.
+
+Usage: python scripts/check_query_plans.py [-v]
+"""
+import datetime
+import os
+import re
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from webapp import db  # noqa: E402
+
+DAY = datetime.date(2025, 1, 15)
+
+# (label, call) pairs covering every read/write query function in db.py
+CASES: List[Tuple[str, Callable[[], object]]] = [
+    ("get_dashboard_counts", lambda: db.get_dashboard_counts(DAY)),
+    ("get_students", lambda: db.get_students()),
+    ("search_students(exam)", lambda: db.search_students(exam_number="E00010")),
+    ("search_students(name)", lambda: db.search_students(name_contains="طالب 1")),
+    ("get_student_id_by_exam", lambda: db.get_student_id_by_exam("E00010")),
+    ("upsert_attendance_for_date", lambda: db.upsert_attendance_for_date("E00010", DAY, "present", "s1")),
+    ("upsert_attendance_bulk", lambda: db.upsert_attendance_bulk(DAY, [("E00010", "absent"), ("E00011", "present")], "s1")),
+    ("get_attendance_for_date_stage_section", lambda: db.get_attendance_for_date_stage_section(DAY)),
+    ("get_attendance_for_date_stage_section(stage)", lambda: db.get_attendance_for_date_stage_section(DAY, "st1", "A", "LAB1", "s1")),
+    ("get_attendance_statuses", lambda: db.get_attendance_statuses(DAY, "st1", "A", None, "s1")),
+    ("get_students_by_stage_section", lambda: db.get_students_by_stage_section("st1", "A", "LAB1")),
+    ("get_students_by_stage_section(stage)", lambda: db.get_students_by_stage_section("st1", None)),
+    ("get_attendance_by_student", lambda: db.get_attendance_by_student("E00010")),
+    ("get_attendance_page_for_student", lambda: db.get_attendance_page_for_student("E00010", after=[db._day(DAY), 1], page_size=5)),
+    ("autocomplete_students(name)", lambda: db.autocomplete_students("طالب", after=["طالب 10", 11])),
+    ("autocomplete_students(exam)", lambda: db.autocomplete_students("E0001", after=["E00012"])),
+    ("get_attendance_report_between_dates", lambda: db.get_attendance_report_between_dates(DAY, DAY + datetime.timedelta(days=7))),
+    ("get_attendance_report_between_dates(stage)", lambda: db.get_attendance_report_between_dates(DAY, DAY + datetime.timedelta(days=7), "st1", "A")),
+    ("get_attendance_report_page", lambda: db.get_attendance_report_page(DAY, DAY + datetime.timedelta(days=7), after=[db._day(DAY), "st1", "A", "LAB2", "طالب 1", "E00001", 1])),
+    ("count_attendance_report", lambda: db.count_attendance_report(DAY, DAY + datetime.timedelta(days=7), "st1")),
+    ("get_report_stamp", lambda: db.get_report_stamp(DAY, DAY + datetime.timedelta(days=30), "st1")),
+    ("get_distinct_stages", lambda: db.get_distinct_stages()),
+    ("get_sections_for_stage", lambda: db.get_sections_for_stage("st1")),
+    ("get_distinct_labs", lambda: db.get_distinct_labs()),
+    ("get_students_filtered", lambda: db.get_students_filtered()),
+    ("get_students_filtered(stage)", lambda: db.get_students_filtered(stage="st1", section="A")),
+    ("get_students_filtered(name)", lambda: db.get_students_filtered(name_contains="طالب", stage="st1")),
+    ("update_student", lambda: db.update_student(10, "طالب 9", "E00009", "st1", "A", "LAB1")),
+    ("delete_student", lambda: db.delete_student(999999)),
+    ("get_attendance_matrix", lambda: db.get_attendance_matrix(DAY, DAY + datetime.timedelta(days=7), "st1")),
+    ("get_absence_rates", lambda: db.get_absence_rates(DAY, DAY + datetime.timedelta(days=7), "st1")),
+    ("get_absence_rates(section)", lambda: db.get_absence_rates(DAY, DAY + datetime.timedelta(days=7), by="section")),
+    ("find_active_export_job", lambda: db.find_active_export_job("0" * 64)),
+    ("delete_finished_export_jobs", lambda: db.delete_finished_export_jobs(datetime.datetime(2000, 1, 1))),
+    # Last: moves the seeded year into an archive, then reads it back through the partitions
+    ("archive_closed_years", lambda: db.archive_closed_years(datetime.date(2025, 10, 1))),
+    ("get_attendance_report_page(archive)", lambda: db.get_attendance_report_page(DAY, DAY + datetime.timedelta(days=7), after=[db._day(DAY), "st1", "A", "LAB2", "طالب 1", "E00001", 1])),
+    ("count_attendance_report(archive)", lambda: db.count_attendance_report(DAY, DAY + datetime.timedelta(days=7), "st1")),
+    ("get_absence_rates(archive)", lambda: db.get_absence_rates(DAY, DAY + datetime.timedelta(days=7), "st1")),
+    ("get_attendance_page_for_student(archive)", lambda: db.get_attendance_page_for_student("E00010", page_size=5)),
+    ("upsert_attendance_for_date(archive)", lambda: db.upsert_attendance_for_date("E00011", DAY, "absent", "s1")),
+    ("delete_student(archive)", lambda: db.delete_student(12)),
+]
+
+# Plan details that mean the query reads a whole table or sorts rows in a temp B-tree.
+# "RIGHT PART OF ORDER BY" is tolerated: rows already arrive ordered by the leading
+# (indexed) key and SQLite only sorts each small group, e.g. one day of a report.
+BAD_PLAN = re.compile(r"^SCAN (?!.*(USING (COVERING )?INDEX|VIRTUAL TABLE))|USE TEMP B-TREE FOR (?!RIGHT PART)")
+
+# Queries whose purpose is to read every row; the scan is inherent.
+ALLOWED_SCANS = {
+    "archive_closed_years",
+    "get_students",
+    "get_students_filtered",
+}
+
+# Name searches sort the students students_fts matched, not the whole table.
+ALLOWED_SORTS = {
+    "search_students(name)",
+    "get_students_filtered(name)",
+    "autocomplete_students(name)",
+}
+
+# Writes to a closed year take the archived rows they move or delete out of the dashboard
+# summary: those few rows are grouped into a materialized subquery ("SCAN x") first.
+ALLOWED_SUMMARY_CORRECTIONS = {
+    "upsert_attendance_for_date(archive)",
+    "delete_student(archive)",
+}
+
+# Aggregate reports: grouping the matched rows needs a temp B-tree, and the rows of
+# several partitions are gathered into a materialized subquery ("SCAN a") first.
+ALLOWED_AGGREGATES = {
+    "get_attendance_matrix",
+    "get_absence_rates",
+    "get_absence_rates(section)",
+    "get_absence_rates(archive)",
+}
+
+
+def _seed(students: int = 2000, days: int = 20) -> None:
+    conn = db.get_conn()
+    now = datetime.datetime(2025, 1, 1).isoformat(timespec="seconds")
+    with conn:
+        conn.executemany(
+            "INSERT INTO students(name, exam_number, stage, section, lab, created_at) VALUES (?,?,?,?,?,?)",
+            [
+                (f"طالب {i}", f"E{i:05d}", f"st{i % 4}", "AB"[i % 2], f"LAB{i % 4 + 1}", now)
+                for i in range(students)
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO attendance(student_id, date, status, subject) VALUES (?,?,?,?)",
+            [
+                (sid, (DAY + datetime.timedelta(days=d)).isoformat(), "present" if (sid + d) % 5 else "absent", "s1")
+                for d in range(days)
+                for sid in range(1, students + 1)
+            ],
+        )
+        conn.execute("ANALYZE")
+
+
+def _plan(conn, sql: str) -> List[str]:
+    return [r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()]
+
+
+def main() -> int:
+    verbose = "-v" in sys.argv[1:]
+    tmp = tempfile.mkdtemp()
+    db.DB_PATH = Path(os.path.join(tmp, "plans.db"))
+    db.ARCHIVE_DIR = Path(os.path.join(tmp, "archive"))
+    try:
+        return _check_plans(verbose)
+    finally:
+        db.close_conn()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _check_plans(verbose: bool) -> int:
+    db.init_db()
+    _seed()
+    conn = db.get_conn()
+
+    failures = 0
+    for label, call in CASES:
+        statements: List[str] = []
+        conn.set_trace_callback(statements.append)
+        try:
+            call()
+        finally:
+            conn.set_trace_callback(None)
+        for sql in dict.fromkeys(statements):  # triggers re-report their statement per row
+            if not re.match(r"\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", sql, re.I):
+                continue
+            for detail in _plan(conn, sql):
+                if verbose:
+                    print(f"{label}: {detail}")
+                if label in ALLOWED_SORTS and detail == "USE TEMP B-TREE FOR ORDER BY":
+                    continue
+                if label in ALLOWED_SUMMARY_CORRECTIONS and detail in ("USE TEMP B-TREE FOR GROUP BY", "SCAN x"):
+                    continue
+                if label in ALLOWED_AGGREGATES and (detail.startswith("USE TEMP B-TREE") or detail == "SCAN a"):
+                    continue
+                if BAD_PLAN.search(detail) and not (label in ALLOWED_SCANS and detail.startswith("SCAN")):
+                    failures += 1
+                    print(f"FAIL {label}: {detail}\n    {' '.join(sql.split())[:200]}")
+    print("query plans OK" if not failures else f"{failures} bad plan step(s)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
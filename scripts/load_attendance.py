@@ -0,0 +1,214 @@
+"""
+Load test for roll call at the top of the hour: starts `gunicorn run:app` (with the
+project's gunicorn.conf.py) on a synthetic database, fires N simultaneous /attendance
+POSTs, each a whole section's roll call for its own subject, and reports p50/p95/max
+latency. --compare runs sync workers, gthread without group commit, and gthread with
+group commit back to back; every run checks that all the posted rows were saved.
+
+Usage:
+    python scripts/load_attendance.py [--concurrency 50] [--rounds 3] [--students 2000] [--days 20]
+                                      [--worker-class gthread] [--workers 2] [--threads 8]
+                                      [--no-group-commit] [--compare]
+"""
+import argparse
+import datetime
+import http.client
+import itertools
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+from urllib.parse import urlencode
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import synthetic_data  # noqa: E402
+from webapp import db, metrics  # noqa: E402
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_server(env: Dict[str, str], port: int) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "run:app", "--bind", f"127.0.0.1:{port}", "--log-level", "warning"],
+        cwd=ROOT, env={**os.environ, **env},
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {server.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", "/")
+            conn.getresponse().read()
+            conn.close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("gunicorn did not start within 30s")
+
+
+def _roll_calls(concurrency: int, date: datetime.date, seed: int) -> List[Tuple[str, str, str, dict]]:
+    """(stage, section, subject, form) per request: distinct sections x subjects, so no two overlap."""
+    combos = list(itertools.product(synthetic_data.STAGES, synthetic_data.SECTIONS, synthetic_data.SUBJECTS))
+    if concurrency > len(combos):
+        raise ValueError(f"at most {len(combos)} distinct roll calls")
+    rng = random.Random(seed)
+    calls = []
+    for stage, section, subject in combos[:concurrency]:
+        roster = db.get_conn().execute(
+            "SELECT exam_number FROM students WHERE stage = ? AND section = ?", (stage, section)
+        ).fetchall()
+        form = {"stage": stage, "section": section, "lab": "الكل", "subject": subject, "date": date.isoformat()}
+        for (exam_number,) in roster:
+            form[f"status_{exam_number}"] = "absent" if rng.random() < synthetic_data.ABSENCE_RATE else "present"
+        calls.append((stage, section, subject, form))
+    return calls
+
+
+def _fire(port: int, method: str, requests: List[Tuple[str, bytes]]) -> Tuple[List[float], List[str]]:
+    """Send all requests at once, one thread and connection each; returns latencies (ms) and errors."""
+    barrier = threading.Barrier(len(requests))
+    latencies: List[float] = []
+    errors: List[str] = []
+    lock = threading.Lock()
+
+    def send(path: str, body: bytes) -> None:
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        conn.connect()
+        headers = {"Content-Type": "application/x-www-form-urlencoded"} if body else {}
+        barrier.wait()
+        start = time.perf_counter()
+        try:
+            conn.request(method, path, body=body or None, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                if response.status in (200, 302):
+                    latencies.append(elapsed)
+                else:
+                    errors.append(f"{method} {path[:60]} -> {response.status}")
+        except OSError as exc:
+            with lock:
+                errors.append(f"{method} {path[:60]} -> {exc}")
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=send, args=request) for request in requests]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+def _saved_rows(date: datetime.date) -> int:
+    row = db.get_conn().execute("SELECT COUNT(*) FROM attendance_compact WHERE day = ?", (db._day(date),)).fetchone()
+    return int(row[0])
+
+
+def run(label: str, env: Dict[str, str], args: argparse.Namespace, first_date: datetime.date) -> dict:
+    port = _free_port()
+    server = _start_server(env, port)
+    try:
+        # Warm every worker (lazy imports, lookups) before measuring
+        _fire(port, "GET", [("/attendance?" + urlencode({"stage": synthetic_data.STAGES[0]}), b"")] * args.concurrency)
+        latencies: List[float] = []
+        errors: List[str] = []
+        missing = 0
+        for round_no in range(args.rounds):
+            date = first_date + datetime.timedelta(days=round_no)
+            calls = _roll_calls(args.concurrency, date, round_no)
+            requests = [("/attendance", urlencode(form).encode("utf-8")) for _, _, _, form in calls]
+            expected = sum(1 for _, _, _, form in calls for key in form if key.startswith("status_"))
+            round_latencies, round_errors = _fire(port, "POST", requests)
+            latencies += round_latencies
+            errors += round_errors
+            missing += expected - _saved_rows(date)
+    finally:
+        server.terminate()
+        server.wait()
+    result = {
+        "requests": len(latencies) + len(errors),
+        "errors": len(errors),
+        "missing_rows": missing,
+        "p50_ms": round(statistics.median(latencies), 1) if latencies else None,
+        "p95_ms": round(statistics.quantiles(latencies, n=20)[-1], 1) if len(latencies) > 1 else None,
+        "max_ms": round(max(latencies), 1) if latencies else None,
+    }
+    print(
+        f"{label:>28}: p50 {result['p50_ms']}ms  p95 {result['p95_ms']}ms  max {result['max_ms']}ms  "
+        f"({result['requests']} POSTs, {result['errors']} errors, {result['missing_rows']} rows missing)"
+    )
+    for line in errors[:5]:
+        print(f"    {line}")
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=20)
+    parser.add_argument("--worker-class", default="gthread")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--no-group-commit", action="store_true")
+    parser.add_argument("--compare", action="store_true", help="run sync, gthread, and gthread + group commit")
+    args = parser.parse_args()
+
+    metrics.SLOW_QUERY_MS = float("inf")
+    tmp = Path(tempfile.mkdtemp())
+    start = time.perf_counter()
+    scale = synthetic_data.generate(tmp / "load.db", args.students, args.days, 4)
+    print(f"generated {scale['students']} students, {scale['attendance_rows']} attendance rows in {time.perf_counter() - start:.1f}s")
+    # New days after the history, one per round and configuration, so every POST inserts fresh rows
+    next_day = datetime.date.fromisoformat(scale["last_day"]) + datetime.timedelta(days=1)
+
+    base = {
+        "ATTENDANCE_DB_PATH": str(db.DB_PATH),
+        "ATTENDANCE_ARCHIVE_DIR": str(tmp / "archive"),
+        "REPORT_CACHE_DIR": str(tmp / "report_cache"),
+        "WEB_CONCURRENCY": str(args.workers),
+        "SLOW_QUERY_MS": "inf",  # waits under load are the point here; keep the server log quiet
+    }
+    if args.compare:
+        configs = [
+            ("sync", {"GUNICORN_WORKER_CLASS": "sync", "GUNICORN_THREADS": "1", "GROUP_COMMIT": "0"}),
+            (f"gthread x{args.threads}", {"GUNICORN_WORKER_CLASS": "gthread", "GUNICORN_THREADS": str(args.threads), "GROUP_COMMIT": "0"}),
+            (f"gthread x{args.threads} + group commit", {"GUNICORN_WORKER_CLASS": "gthread", "GUNICORN_THREADS": str(args.threads), "GROUP_COMMIT": "1"}),
+        ]
+    else:
+        label = f"{args.worker_class} x{args.threads}" + ("" if args.no_group_commit else " + group commit")
+        configs = [(label, {
+            "GUNICORN_WORKER_CLASS": args.worker_class,
+            "GUNICORN_THREADS": str(args.threads),
+            "GROUP_COMMIT": "0" if args.no_group_commit else "1",
+        })]
+
+    print(f"{args.concurrency} simultaneous roll calls x {args.rounds} rounds, {args.workers} worker(s)")
+    failed = False
+    for label, env in configs:
+        result = run(label, {**base, **env}, args, next_day)
+        next_day += datetime.timedelta(days=args.rounds)
+        failed |= bool(result["errors"] or result["missing_rows"])
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Fill a SQLite file with a synthetic roster and attendance history at a chosen scale:
+N students spread over the four stages, their sections and labs, and M class days
+(Sunday to Thursday, ending today) x K subjects of attendance, about 12% absent.
+Used by the benchmarks; also handy for trying the app on a realistic database.
+
+Usage: python scripts/synthetic_data.py PATH [students] [days] [subjects]   (default 2000 100 4)
+"""
+import datetime
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from webapp import db  # noqa: E402
+
+STAGES = ["الأولى", "الثانية", "الثالثة", "الرابعة"]
+SECTIONS = ["A", "B", "C"]
+LABS = ["LAB1", "LAB2", "LAB3", "LAB4"]
+FIRST = ["محمد", "أحمد", "علي", "حسين", "فاطمة", "زينب", "مريم", "إبراهيم", "عائشة", "مصطفى", "آمنة", "يوسف"]
+LAST = ["الجبوري", "العبيدي", "الموسوي", "الحسيني", "الربيعي", "التميمي", "الساعدي", "الزبيدي", "الخفاجي", "الدليمي"]
+SUBJECTS = ["برمجة", "قواعد بيانات", "شبكات", "حساب التفاضل", "هياكل بيانات", "أنظمة تشغيل", "رسم هندسي", "إحصاء"]
+ABSENCE_RATE = 0.12
+SEED = 20240901
+
+
+def class_days(days: int, end: datetime.date) -> List[datetime.date]:
+    """The last `days` teaching days (Friday and Saturday off) up to and including `end`."""
+    out: List[datetime.date] = []
+    day = end
+    while len(out) < days:
+        if day.weekday() not in (4, 5):
+            out.append(day)
+        day -= datetime.timedelta(days=1)
+    return out[::-1]
+
+
+def student_rows(students: int) -> List[Tuple[str, str, str, str, str, str]]:
+    now = datetime.datetime.now().isoformat(timespec="seconds")
+    return [
+        (
+            f"{FIRST[i % len(FIRST)]} {FIRST[i // len(FIRST) % len(FIRST)]} {LAST[i // 7 % len(LAST)]}",
+            f"E{i:06d}",
+            STAGES[i % len(STAGES)],
+            SECTIONS[i // len(STAGES) % len(SECTIONS)],
+            LABS[i // (len(STAGES) * len(SECTIONS)) % len(LABS)],
+            now,
+        )
+        for i in range(students)
+    ]
+
+
+def _attendance_rows(student_ids: List[int], days: List[datetime.date], subjects: int) -> Iterator[Tuple[int, int, int, int]]:
+    rng = random.Random(SEED)
+    for date in days:
+        day = db._day(date)
+        for subject_id in range(1, subjects + 1):
+            for sid in student_ids:
+                yield sid, day, subject_id, 0 if rng.random() < ABSENCE_RATE else 1
+
+
+def generate(
+    path: Path,
+    students: int = 2000,
+    days: int = 100,
+    subjects: int = 4,
+    end: Optional[datetime.date] = None,
+) -> dict:
+    """
+    Create a fresh database at `path` (which must not exist yet) and point db.DB_PATH at it.
+    Returns the scale actually written: students, days, subjects, attendance rows, first/last day.
+    """
+    if path.exists():
+        raise FileExistsError(path)
+    if not 1 <= subjects <= len(SUBJECTS):
+        raise ValueError(f"subjects must be between 1 and {len(SUBJECTS)}")
+    db.close_conn()
+    db.DB_PATH = path
+    db.init_db()
+    dates = class_days(days, end or datetime.date.today())
+    conn = db.get_conn()
+    with conn:
+        conn.executemany(
+            "INSERT INTO students(name, exam_number, stage, section, lab, created_at) VALUES (?,?,?,?,?,?)",
+            student_rows(students),
+        )
+        conn.executemany("INSERT INTO subjects(id, name) VALUES (?, ?)", list(enumerate(SUBJECTS[:subjects], 1)))
+        student_ids = [r[0] for r in conn.execute("SELECT id FROM students ORDER BY id")]
+        # Straight into the compact table: the attendance view's triggers cost a lookup per row
+        conn.executemany(
+            "INSERT INTO attendance_compact(student_id, day, subject_id, status) VALUES (?,?,?,?)",
+            _attendance_rows(student_ids, dates, subjects),
+        )
+    conn.execute("ANALYZE")
+    db.invalidate_lookups()
+    return {
+        "students": students,
+        "days": len(dates),
+        "subjects": subjects,
+        "attendance_rows": students * len(dates) * subjects,
+        "first_day": dates[0].isoformat() if dates else None,
+        "last_day": dates[-1].isoformat() if dates else None,
+    }
+
+
+def main() -> None:
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    path = Path(sys.argv[1])
+    students = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    days = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+    subjects = int(sys.argv[4]) if len(sys.argv) > 4 else 4
+    start = time.perf_counter()
+    scale = generate(path, students, days, subjects)
+    print(
+        f"wrote {scale['students']} students, {scale['attendance_rows']} attendance rows "
+        f"({scale['first_day']} .. {scale['last_day']}) to {path} in {time.perf_counter() - start:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from webapp import create_app, db, report_cache  # noqa: E402
+
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    """An empty, migrated database (plus archive and report cache folders) under tmp_path."""
+    db.close_conn()
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "attendance.db")
+    monkeypatch.setattr(db, "ARCHIVE_DIR", tmp_path / "archive")
+    monkeypatch.setattr(report_cache, "REPORT_CACHE_DIR", tmp_path / "report_cache")
+    db.init_db()
+    db.invalidate_lookups()
+    yield db
+    db.close_conn()
+
+
+@pytest.fixture
+def client(fresh_db):
+    return create_app().test_client()
@@ -0,0 +1,95 @@
+import datetime
+import sqlite3
+
+from webapp import db
+
+FIRST_YEAR = 2014
+YEARS = 10  # academic years 2014/15 .. 2023/24: as many archives as SQLite attaches by default
+
+
+def _archive_years(years: int = YEARS) -> None:
+    db.add_student("طالب", "E1", "الأولى", "A", "LAB1")
+    for year in range(FIRST_YEAR, FIRST_YEAR + years):
+        db.upsert_attendance_for_date("E1", datetime.date(year, 10, 1), "present", "برمجة")
+    db.archive_closed_years(datetime.date(FIRST_YEAR + years, 10, 1))
+    assert len(db.archived_years()) == years
+
+
+def test_history_across_more_archives_than_the_old_cap(fresh_db):
+    _archive_years()
+    assert len(db.get_attendance_by_student("E1")) == YEARS
+    page, key = db.get_attendance_page_for_student("E1", page_size=4)
+    seen = len(page)
+    while key:
+        page, key = db.get_attendance_page_for_student("E1", after=key, page_size=4)
+        seen += len(page)
+    assert seen == YEARS
+    everything = (datetime.date(FIRST_YEAR, 9, 1), datetime.date(FIRST_YEAR + YEARS, 8, 31))
+    assert db.count_attendance_report(*everything) == YEARS
+    assert len(db.get_attendance_report_page(*everything, page_size=100)[0]) == YEARS
+    assert len(db.get_absence_rates(*everything)) == 1
+
+
+def test_making_room_never_detaches_an_archive_the_query_uses(fresh_db):
+    _archive_years(5)
+    db.get_conn().setlimit(sqlite3.SQLITE_LIMIT_ATTACHED, 3)
+    # Attaches 2014..2016, then needs 2016..2018: only 2014 and 2015 may go
+    assert db.count_attendance_report(datetime.date(FIRST_YEAR, 9, 1), datetime.date(FIRST_YEAR + 3, 8, 31)) == 3
+    assert db.count_attendance_report(datetime.date(FIRST_YEAR + 2, 9, 1), datetime.date(FIRST_YEAR + 5, 8, 31)) == 3
+
+
+def _closed_year_record():
+    db.add_student("طالب", "E1", "الأولى", "A", "LAB1")
+    day = datetime.date(2023, 10, 1)
+    db.upsert_attendance_for_date("E1", day, "absent", "برمجة")
+    db.archive_closed_years(datetime.date(2024, 10, 1))
+    return day
+
+
+def _assert_single_present(day):
+    assert db.count_attendance_report(day, day) == 1
+    assert [r["status"] for r in db.get_attendance_report_page(day, day)[0]] == ["present"]
+    assert db.get_dashboard_counts(day) == (1, 1, 0)
+    rates = db.get_absence_rates(day, day)
+    assert rates[["present", "absent", "total"]].values.tolist() == [[1, 0, 1]]
+
+
+def test_correction_after_rollover_replaces_the_archived_row(fresh_db):
+    day = _closed_year_record()
+    assert db.upsert_attendance_bulk(day, [("E1", "present")], "برمجة") == (1, [])
+    _assert_single_present(day)
+    # The next rollover moves the corrected row back without counting it twice
+    db.archive_closed_years(datetime.date(2024, 10, 1))
+    _assert_single_present(day)
+
+
+def test_single_correction_after_rollover(fresh_db):
+    day = _closed_year_record()
+    assert db.upsert_attendance_for_date("E1", day, "present", "برمجة")
+    _assert_single_present(day)
+
+
+def test_roll_call_form_correction_after_rollover(client):
+    day = _closed_year_record()
+    response = client.post(
+        "/attendance", query_string={"date": day.isoformat(), "stage": "الأولى", "section": "A"},
+        data={"subject": "برمجة", "status_E1": "present"},
+    )
+    assert response.status_code == 302
+    _assert_single_present(day)
+
+
+def test_deleting_a_student_removes_their_archived_rows(fresh_db):
+    day = _closed_year_record()
+    db.add_student("باقٍ", "E2", "الأولى", "A", "LAB1")
+    # E2's row is written after the rollover: it stays in main until the next one
+    db.upsert_attendance_for_date("E2", day, "present", "برمجة")
+    student_id = db.get_student_id_by_exam("E1")
+
+    db.delete_student(student_id)
+
+    assert db.count_attendance_report(day, day) == 1
+    assert db.get_dashboard_counts(day) == (1, 1, 0)
+    year = db.archived_year(day)
+    with sqlite3.connect(db.archive_path(year)) as archive:
+        assert archive.execute("SELECT COUNT(*) FROM attendance_compact WHERE student_id = ?", (student_id,)).fetchone()[0] == 0
@@ -0,0 +1,29 @@
+import gc
+import os
+
+from webapp import db
+
+
+def test_forked_child_keeps_the_parents_connection_open(fresh_db):
+    conn = db.get_conn()
+    with conn:
+        conn.execute("INSERT INTO students(name, exam_number, stage, created_at) VALUES ('a', 'E1', 'st1', '')")
+
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            # The child opens its own connection; the inherited one stays referenced and open
+            assert db.get_conn() is not conn
+            assert db.get_conn().execute("SELECT COUNT(*) FROM students").fetchone()[0] == 1
+            db.close_conn()
+            gc.collect()
+            assert db._inherited_conns == [conn] and conn.total_changes >= 0
+            code = 0
+        finally:
+            os._exit(code)
+    assert os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1]) == 0
+
+    with conn:
+        conn.execute("INSERT INTO students(name, exam_number, stage, created_at) VALUES ('b', 'E2', 'st1', '')")
+    assert conn.execute("SELECT COUNT(*) FROM students").fetchone()[0] == 2
@@ -0,0 +1,55 @@
+import datetime
+import io
+
+import openpyxl
+import pytest
+
+from webapp import db, reports, utils_export
+from webapp.utils_export import rows_to_excel_file
+
+DAY = datetime.date(2024, 10, 1)
+
+
+def test_excel_keeps_numbers_numeric(fresh_db):
+    db.add_student("طالب", "E1", "الأولى", "A", "LAB1")
+    db.upsert_attendance_for_date("E1", DAY, "absent", "برمجة")
+    db.upsert_attendance_for_date("E1", DAY, "present", "شبكات")
+    columns, rows = reports.report_table("student_rates", (DAY, DAY, None, None, None, None))
+    sheet = openpyxl.load_workbook(rows_to_excel_file(columns, rows)).active
+
+    header = [cell.value for cell in sheet[1]]
+    values = dict(zip(header, (cell.value for cell in sheet[2])))
+    assert values["exam_number"] == "E1"
+    assert (values["present"], values["absent"], values["total"]) == (1, 1, 2)
+    types = {name: cell.data_type for name, cell in zip(header, sheet[2])}
+    assert types["exam_number"] == "s"
+    assert all(types[name] == "n" for name in ("present", "absent", "total", "absence_rate"))
+
+
+def test_parallel_pdf_reuses_one_pool(monkeypatch):
+    pypdf = pytest.importorskip("pypdf")
+    monkeypatch.setattr(utils_export, "PDF_PARALLEL_MIN_ROWS", 0)
+    rows = [(f"2024-10-{i % 28 + 1:02d}", "برمجة", f"طالب {i}", f"E{i}", "الأولى", "A", "LAB1", "present") for i in range(300)]
+    single = pypdf.PdfReader(io.BytesIO(utils_export.rows_to_pdf_bytes(db.REPORT_COLUMNS, rows, title="t", workers=1)))
+    first = utils_export.rows_to_pdf_bytes(db.REPORT_COLUMNS, rows, title="t", workers=3)
+    pool = utils_export._get_pdf_pool()
+    utils_export.rows_to_pdf_bytes(db.REPORT_COLUMNS, rows, title="t", workers=3)
+    assert utils_export._get_pdf_pool() is pool
+    assert len(pypdf.PdfReader(io.BytesIO(first)).pages) == len(single.pages) > 3
+
+
+def test_wide_matrix_pdf_prints_every_date_in_bands(fresh_db):
+    pypdf = pytest.importorskip("pypdf")
+    db.add_student("طالب", "E1", "الأولى", "A", "LAB1")
+    days = [DAY + datetime.timedelta(days=d) for d in range(40)]
+    for day in days:
+        db.upsert_attendance_for_date("E1", day, "present" if day.day % 3 else "absent", "برمجة")
+    filters = (days[0], days[-1], None, None, None, None)
+    columns, rows = reports.report_table("matrix", filters)
+    assert columns[43:] == ["present", "absent", "absence_rate"] and rows[0][43:] == (27, 13, 32.5)
+
+    pdf = utils_export.rows_to_pdf_bytes(columns, rows, title="t", repeat_columns=reports.PDF_REPEAT_COLUMNS["matrix"])
+    pages = [page.extract_text() for page in pypdf.PdfReader(io.BytesIO(pdf)).pages]
+    assert len(pages) > 1
+    assert all("E1" in text for text in pages)
+    assert all(sum(day.isoformat() in text for text in pages) == 1 for day in days)
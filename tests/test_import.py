@@ -0,0 +1,74 @@
+import io
+
+import openpyxl
+
+from webapp import db
+
+HEADER = ["الاسم", "الرقم الامتحاني", "المرحلة", "الشعبة", "المختبر"]
+
+
+def _upload(client, rows, mode="add", header=HEADER):
+    book = openpyxl.Workbook()
+    book.active.append(header)
+    for row in rows:
+        book.active.append(row)
+    data = io.BytesIO()
+    book.save(data)
+    data.seek(0)
+    client.post(
+        "/manage",
+        data={"action": "import", "mode": mode, "excel_file": (data, "roster.xlsx")},
+        content_type="multipart/form-data",
+    )
+    with client.session_transaction() as session:
+        return [message for _, message in session.pop("_flashes", [])]
+
+
+def test_import_reports_each_bad_row_once(client):
+    db.add_student("قديم", "E0", "الأولى", "A", "LAB1")
+    messages = _upload(client, [
+        [" طالب 1 ", "E1", "الأولى", "A", "LAB1"],
+        ["", "E2", "الأولى", "A", "LAB1"],
+        ["طالب 3", "E1", "الأولى", "A", "LAB1"],
+        ["طالب 4", "E0", "الأولى", "A", "LAB1"],
+    ])
+
+    assert messages == [
+        "تم استيراد 1 طالب. 3 خطأ.",
+        "الصف 3 (E2): الاسم والرقم الامتحاني والمرحلة حقول مطلوبة.",
+        "الصف 4 (E1): الرقم الامتحاني مكرر في الملف.",
+        "الصف 5 (E0): الرقم الامتحاني موجود مسبقاً.",
+    ]
+    added = db.get_conn().execute("SELECT name, section, lab FROM students WHERE exam_number = 'E1'").fetchone()
+    assert tuple(added) == ("طالب 1", "A", "LAB1")
+
+
+def test_sync_reports_file_errors_once(client):
+    db.add_student("قديم", "E0", "الأولى", "A", "LAB1")
+    messages = _upload(client, [
+        ["قديم", "E0", "الثانية", "B", ""],
+        ["طالب 1", "E1", "الأولى", None, None],
+        ["طالب 1", "E1", "الأولى", "A", "LAB1"],
+    ], mode="sync")
+
+    assert messages == [
+        "المزامنة: 1 جديد، 1 محدّث، 0 بدون تغيير.",
+        "تم استيراد 1 طالب. 1 خطأ.",
+        "الصف 4 (E1): الرقم الامتحاني مكرر في الملف.",
+    ]
+    rows = db.get_conn().execute("SELECT exam_number, stage, section, lab FROM students ORDER BY exam_number").fetchall()
+    assert [tuple(r) for r in rows] == [("E0", "الثانية", "B", ""), ("E1", "الأولى", "", "")]
+
+
+def test_sync_keeps_columns_missing_from_the_sheet(client):
+    db.add_student("قديم", "E0", "الأولى", "A", "LAB1")
+    db.add_student("ثابت", "E1", "الأولى", "B", "LAB2")
+    messages = _upload(client, [
+        ["قديم", "E0", "الثانية"],
+        ["ثابت", "E1", "الأولى"],
+        ["جديد", "E2", "الأولى"],
+    ], mode="sync", header=HEADER[:3])
+
+    assert messages[0] == "المزامنة: 1 جديد، 1 محدّث، 1 بدون تغيير."
+    rows = db.get_conn().execute("SELECT exam_number, stage, section, lab FROM students ORDER BY exam_number").fetchall()
+    assert [tuple(r) for r in rows] == [("E0", "الثانية", "A", "LAB1"), ("E1", "الأولى", "B", "LAB2"), ("E2", "الأولى", "", "")]
@@ -0,0 +1,43 @@
+import datetime
+
+from webapp import db, jobs
+
+DAY = datetime.date(2024, 10, 1)
+FILTERS = (DAY, DAY, None, None, None, None)
+
+
+def _age(job_id: str, seconds: int) -> None:
+    stamp = (datetime.datetime.now() - datetime.timedelta(seconds=seconds)).isoformat(timespec="seconds")
+    with db.get_conn() as conn:
+        conn.execute("UPDATE export_jobs SET updated_at = ? WHERE id = ?", (stamp, job_id))
+
+
+def test_finished_jobs_expire_after_max_age(fresh_db, monkeypatch):
+    monkeypatch.setattr(jobs, "EXPORT_JOB_MAX_AGE", 3600)
+    db.create_export_job("old-done", "k1", "excel", {})
+    db.update_export_job("old-done", status="done")
+    db.create_export_job("old-failed", "k2", "pdf", {})
+    db.update_export_job("old-failed", status="failed")
+    db.create_export_job("old-running", "k3", "pdf", {})
+    db.update_export_job("old-running", status="running")
+    db.create_export_job("recent-done", "k4", "excel", {})
+    db.update_export_job("recent-done", status="done")
+    for job_id in ("old-done", "old-failed", "old-running"):
+        _age(job_id, 7200)
+
+    assert jobs.expire_jobs() == 2
+    assert db.get_export_job("old-done") is None and db.get_export_job("old-failed") is None
+    assert db.get_export_job("old-running") is not None
+    assert db.get_export_job("recent-done") is not None
+
+
+def test_submitting_an_export_expires_old_jobs(fresh_db, monkeypatch):
+    monkeypatch.setattr(jobs, "EXPORT_JOB_MAX_AGE", 3600)
+    monkeypatch.setattr(jobs, "_executor", None)  # a private pool, shut down below
+    db.create_export_job("old-done", "k1", "excel", {})
+    db.update_export_job("old-done", status="done")
+    _age("old-done", 7200)
+    job_id = jobs.submit_export("excel", FILTERS)
+    assert db.get_export_job("old-done") is None
+    jobs._get_executor().shutdown(wait=True)
+    assert db.get_export_job(job_id)["status"] == "done"
@@ -0,0 +1,77 @@
+import datetime
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from webapp import db
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Waits until a shared start time, so the processes open the database together like
+# gunicorn workers importing run.py
+MIGRATE = """
+import sys, time
+time.sleep(max(0.0, float(sys.argv[1]) - time.time()))
+from webapp import db
+db.init_db()
+print(db.get_conn().execute("PRAGMA user_version").fetchone()[0])
+"""
+
+
+def _baseline_db(path: Path) -> None:
+    """The committed attendance.db (the schema before versioned migrations) with 2,000 students and 9 days."""
+    shutil.copy(ROOT / "attendance.db", path)
+    with sqlite3.connect(path) as conn:
+        conn.execute("DELETE FROM attendance")
+        conn.execute("DELETE FROM students")
+        conn.executemany(
+            "INSERT INTO students(name, exam_number, stage, section, lab, created_at) VALUES (?,?,?,?,?,?)",
+            [(f"طالب {i}", f"E{i:05d}", "الأولى", "AB"[i % 2], "LAB1", "2024-09-01") for i in range(2000)],
+        )
+        conn.execute(
+            """
+            INSERT INTO attendance(student_id, date, status, subject)
+            SELECT s.id, d.date, 'present', 'برمجة'
+            FROM students s, (SELECT '2024-10-0' || value AS date FROM json_each('[1,2,3,4,5,6,7,8,9]')) d
+            """
+        )
+    conn.close()
+
+
+def test_workers_starting_together_migrate_once(tmp_path):
+    path = tmp_path / "attendance.db"
+    _baseline_db(path)
+    env = {
+        **os.environ,
+        "ATTENDANCE_DB_PATH": str(path),
+        "ATTENDANCE_ARCHIVE_DIR": str(tmp_path / "archive"),
+        "REPORT_CACHE_DIR": str(tmp_path / "report_cache"),
+    }
+    start = str(time.time() + 1.5)
+    workers = [
+        subprocess.Popen([sys.executable, "-c", MIGRATE, start], cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        for _ in range(3)
+    ]
+    results = [worker.communicate(timeout=120) for worker in workers]
+    assert [worker.returncode for worker in workers] == [0, 0, 0], [err for _, err in results]
+    assert [out.strip() for out, _ in results] == [str(db.SCHEMA_VERSION)] * 3
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM attendance_compact").fetchone()[0] == 18000
+        assert conn.execute("SELECT COUNT(*) FROM students_fts").fetchone()[0] == 2000
+    conn.close()
+
+
+def test_rerunning_the_fts_and_compact_steps_keeps_the_data(fresh_db):
+    day = datetime.date(2024, 10, 1)
+    db.add_student("طالب", "E1", "الأولى", "A", "LAB1")
+    db.upsert_attendance_for_date("E1", day, "present", "برمجة")
+    db.get_conn().execute("PRAGMA user_version = 5")
+    db.init_db()
+    assert db.get_conn().execute("PRAGMA user_version").fetchone()[0] == db.SCHEMA_VERSION
+    assert [s["exam_number"] for s in db.search_students(name_contains="طالب")] == ["E1"]
+    assert db.count_attendance_report(day, day) == 1
+    assert db.get_dashboard_counts(day) == (1, 1, 0)
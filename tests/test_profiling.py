@@ -0,0 +1,41 @@
+from webapp import profiling
+
+
+def _app(environ, start_response):
+    start_response("200 OK", [("Content-Type", "text/plain")])
+    return [b"ok"]
+
+
+def _call(middleware, query="", header=None):
+    environ = {"REQUEST_METHOD": "GET", "PATH_INFO": "/report", "QUERY_STRING": query}
+    if header is not None:
+        environ["HTTP_X_PROFILE"] = header
+    seen = {}
+
+    def start_response(status, headers, exc_info=None):
+        seen.update(headers)
+
+    assert b"".join(middleware(environ, start_response)) == b"ok"
+    return seen.get("X-Profile-File")
+
+
+def test_only_an_explicit_opt_in_is_profiled(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", tmp_path)
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 0)
+    middleware = profiling.ProfilingMiddleware(_app, mode="cprofile")
+
+    assert _call(middleware, header="1")
+    assert _call(middleware, query="page=2&_profile=1")
+    assert _call(middleware, header="0") is None
+    assert _call(middleware, query="x_profile=1") is None
+    assert _call(middleware, query="_profile=0") is None
+    assert _call(middleware) is None
+
+
+def test_profiles_of_the_same_request_keep_separate_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", tmp_path)
+    middleware = profiling.ProfilingMiddleware(_app, mode="cprofile")
+
+    names = {_call(middleware, header="1") for _ in range(5)}
+    assert len(names) == 5
+    assert len(list(tmp_path.glob("*.prof"))) == 5
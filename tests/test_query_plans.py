@@ -0,0 +1,21 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_no_query_scans_a_table_or_sorts_in_a_temp_btree():
+    # The script seeds its own temporary database; a separate process keeps its
+    # module-level db.DB_PATH change out of the other tests
+    result = subprocess.run(
+        [sys.executable, str(ROOT / "scripts" / "check_query_plans.py")],
+        cwd=ROOT,
+        env={**os.environ, "SLOW_QUERY_MS": "inf"},
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert result.stdout.strip().endswith("query plans OK")
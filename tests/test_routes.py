@@ -0,0 +1,50 @@
+import base64
+import datetime
+import json
+import os
+
+import pytest
+
+from webapp import db
+
+DAY = datetime.date(2024, 10, 1)
+
+
+def _cursor(key) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key, ensure_ascii=False).encode("utf-8")).decode("ascii")
+
+
+@pytest.fixture
+def report(client):
+    for i in range(3):
+        db.add_student(f"طالب {i}", f"E{i}", "الأولى", "A", "LAB1")
+        db.upsert_attendance_for_date(f"E{i}", DAY, "present", "برمجة")
+    return client
+
+
+@pytest.mark.parametrize("key", [
+    ["2024-10-01", "الأولى", "A", "LAB1", "طالب 0", "E0", 1],  # ISO-date cursor from before the compact table
+    [db._day(DAY), "الأولى", "A"],
+    [db._day(DAY), "الأولى", "A", "LAB1", "طالب 0", "E0", "1"],
+    {"day": 1},
+])
+def test_export_preview_with_malformed_cursor_shows_first_page(report, key):
+    query = {"start": DAY.isoformat(), "end": DAY.isoformat(), "per_page": 50, "after": _cursor(key)}
+    response = report.get("/export", query_string=query)
+    assert response.status_code == 200
+    assert all(f"E{i}" in response.get_data(as_text=True) for i in range(3))
+
+
+def test_export_preview_pages_with_a_valid_cursor(report):
+    rows, key = db.get_attendance_report_page(DAY, DAY, page_size=2)
+    assert db.is_report_key(key)
+    query = {"start": DAY.isoformat(), "end": DAY.isoformat(), "per_page": 2, "after": _cursor(key)}
+    html = report.get("/export", query_string=query).get_data(as_text=True)
+    assert "E2" in html and "E0" not in html
+
+
+def test_metrics_series_carry_the_worker_pid(report):
+    report.get("/")
+    body = report.get("/metrics").get_data(as_text=True)
+    samples = [line for line in body.splitlines() if line and not line.startswith("#")]
+    assert samples and all(f'worker="{os.getpid()}"' in line for line in samples)
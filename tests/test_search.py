@@ -0,0 +1,38 @@
+from webapp import db
+
+NAMES = ["زينب علي", "احمد علي", "علي حسين", "محمد كاظم"]
+
+
+def _add_students(names):
+    for i, name in enumerate(names):
+        assert db.add_student(name, f"E{i:03d}", "st1")[0]
+
+
+def test_name_search_lists_matches_by_name(fresh_db):
+    _add_students(NAMES)
+
+    assert [s["name"] for s in db.search_students(name_contains="علي")] == ["احمد علي", "زينب علي", "علي حسين"]
+    assert [s["name"] for s in db.search_students(name_contains="علي", limit=2)] == ["احمد علي", "زينب علي"]
+    assert [s["name"] for s in db.get_students_filtered(name_contains="عل حس")] == ["علي حسين"]
+
+
+def test_punctuation_only_search_lists_everyone(fresh_db):
+    _add_students(NAMES)
+
+    everyone = [s["name"] for s in db.search_students()]
+    assert [s["name"] for s in db.search_students(name_contains="...")] == everyone
+    assert [s["name"] for s in db.get_students_filtered(name_contains=" - ")] == everyone
+
+
+def test_autocomplete_pages_through_every_match_once(fresh_db):
+    _add_students(NAMES + ["علي كريم", "علي حسين"])
+
+    seen, key = [], None
+    while True:
+        rows, key = db.autocomplete_students("عل", after=key, limit=2)
+        seen += [(s["name"], s["exam_number"]) for s in rows]
+        if key is None:
+            break
+    assert seen == sorted(seen) and len(seen) == 5
+    assert "id" not in rows[0]
+    assert db.autocomplete_students("عل", after=[4], limit=2)[0] == db.autocomplete_students("عل", limit=2)[0]
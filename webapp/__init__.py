@@ -7,8 +7,20 @@ def create_app() -> Flask:
         SECRET_KEY="change-me",
     )
 
+    from .db import release_conn
+    app.teardown_appcontext(release_conn)
+
+    from .metrics import init_app as init_metrics
+    init_metrics(app)
+
     from .routes import bp as main_bp
     app.register_blueprint(main_bp)
+
+    from .cli import register_cli
+    register_cli(app)
+
+    from .profiling import init_app as init_profiling
+    init_profiling(app)
     return app
 
 
@@ -0,0 +1,26 @@
+import datetime
+from typing import Optional
+
+import click
+from flask import Flask
+
+from . import db
+
+
+@click.command("rollover-attendance")
+@click.option("--today", type=click.DateTime(formats=["%Y-%m-%d"]), default=None, help="Treat this date as today.")
+@click.option("--vacuum", is_flag=True, help="VACUUM attendance.db afterwards to return the freed space.")
+def rollover_attendance_command(today: Optional[datetime.datetime], vacuum: bool) -> None:
+    """Move attendance from closed academic years into per-year archive databases."""
+    moved = db.archive_closed_years(today.date() if today else None)
+    if not moved:
+        click.echo("nothing to archive")
+    for year, rows in moved:
+        click.echo(f"{year}-{year + 1}: {rows} rows -> {db.archive_path(year)}")
+    if vacuum and moved:
+        db.get_conn().execute("VACUUM")
+        click.echo("vacuumed")
+
+
+def register_cli(app: Flask) -> None:
+    app.cli.add_command(rollover_attendance_command)
@@ -1,22 +1,121 @@
+from __future__ import annotations
+
 import datetime
+import json
+import os
 import sqlite3
+import threading
 from pathlib import Path
-from typing import Iterable, List, Optional, Tuple
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 
-import pandas as pd
+from . import metrics
 
+if TYPE_CHECKING:
+    import pandas as pd  # imported where frames are built, to keep worker startup light
 
-DB_PATH = Path(__file__).resolve().parent.parent / "attendance.db"
 
+DB_PATH = Path(os.environ.get("ATTENDANCE_DB_PATH", Path(__file__).resolve().parent.parent / "attendance.db"))
 
-def get_conn() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
+# Closed academic years are moved to one database file per year (see archive_closed_years)
+ARCHIVE_DIR = Path(os.environ.get("ATTENDANCE_ARCHIVE_DIR", DB_PATH.parent / "archive"))
+ACADEMIC_YEAR_START_MONTH = int(os.environ.get("ACADEMIC_YEAR_START_MONTH", "9"))
+
+# Applied once to every new connection
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA busy_timeout=5000",
+)
+# How long a starting process waits for another process's schema migration (ms)
+MIGRATION_LOCK_TIMEOUT_MS = int(os.environ.get("MIGRATION_LOCK_TIMEOUT_MS", "600000"))
+
+_local = threading.local()
+# Connections a forked child inherited from its parent. Letting one be garbage collected
+# would close it, and SQLite's close in the child can checkpoint and remove the WAL the
+# parent is still using; so they stay referenced, unused, for the life of the process.
+_inherited_conns: List[sqlite3.Connection] = []
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_PATH, factory=metrics.InstrumentedConnection if metrics.METRICS_ENABLED else sqlite3.Connection)
     conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
     return conn
 
 
+def get_conn() -> sqlite3.Connection:
+    """
+    Return this thread's cached connection, opening it on first use.
+    Connections inherited across fork() or pointing at an old DB_PATH are replaced.
+    """
+    key = (os.getpid(), str(DB_PATH))
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "key", None) != key:
+        if conn is not None and _local.key[0] == key[0]:
+            conn.close()
+        elif conn is not None:
+            _inherited_conns.append(conn)
+        conn = _connect()
+        _local.conn = conn
+        _local.key = key
+    return conn
+
+
+def release_conn(exc: Optional[BaseException] = None) -> None:
+    """Flask teardown hook: roll back anything a request left uncommitted."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.key[0] == os.getpid() and conn.in_transaction:
+        conn.rollback()
+
+
+def close_conn(exc: Optional[BaseException] = None) -> None:
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.key[0] == os.getpid():
+        conn.close()
+    elif conn is not None:
+        _inherited_conns.append(conn)
+    _local.conn = None
+    _local.key = None
+
+
+def _forget_inherited_conn() -> None:
+    # Never close a parent's connection from the child, not even by dropping the last reference
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        _inherited_conns.append(conn)
+    _local.conn = None
+    _local.key = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_inherited_conn)
+
+
 def init_db() -> None:
-    with get_conn() as conn:
+    conn = get_conn()
+    # Up to date already (the usual case on worker start): skip the table checks
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return
+    # Every worker runs this at import: one migrates, the others wait for its write lock
+    # rather than giving up after the usual busy timeout
+    busy_timeout = conn.execute("PRAGMA busy_timeout").fetchone()[0]
+    conn.execute(f"PRAGMA busy_timeout={MIGRATION_LOCK_TIMEOUT_MS}")
+    try:
+        _create_base_tables(conn)
+        _apply_migrations(conn)
+    finally:
+        conn.execute(f"PRAGMA busy_timeout={busy_timeout}")
+
+
+def _create_base_tables(conn: sqlite3.Connection) -> None:
+    with conn:
+        # The checks below and the ALTERs they guard run under one write lock
+        conn.execute("BEGIN IMMEDIATE")
         c = conn.cursor()
         c.execute(
             """
@@ -43,19 +142,16 @@ def init_db() -> None:
             )
             """
         )
-        conn.commit()
 
         # Migration: add lab column to students if missing
         cols_stud = {r[1] for r in c.execute("PRAGMA table_info(students)").fetchall()}
         if "lab" not in cols_stud:
             c.execute("ALTER TABLE students ADD COLUMN lab TEXT")
-            conn.commit()
 
         # Migration: add subject column to attendance if missing
         cols_att = {r[1] for r in c.execute("PRAGMA table_info(attendance)").fetchall()}
         if "subject" not in cols_att:
             c.execute("ALTER TABLE attendance ADD COLUMN subject TEXT")
-            conn.commit()
             # Update unique constraint to include subject
             c.execute("DROP INDEX IF EXISTS attendance_student_date_unique")
             # Drop old unique constraint if exists
@@ -63,7 +159,617 @@ def init_db() -> None:
                 c.execute("CREATE UNIQUE INDEX IF NOT EXISTS attendance_student_date_subject_unique ON attendance(student_id, date, COALESCE(subject, ''))")
             except sqlite3.OperationalError:
                 pass  # Index might already exist
-            conn.commit()
+
+
+# Arabic spelling variants folded together for name search: alef forms, taa marbuta,
+# alef maqsura, and diacritics/tatweel dropped. Used both in SQL (triggers) and Python (queries).
+_ARABIC_FOLD = {
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ة": "ه",
+    "ى": "ي",
+    **{chr(c): "" for c in range(0x064B, 0x0653)},  # fathatan .. sukun
+    "ٰ": "",  # superscript alef
+    "ـ": "",  # tatweel
+}
+_ARABIC_FOLD_TABLE = str.maketrans(_ARABIC_FOLD)
+
+
+def normalize_arabic(text: str) -> str:
+    return (text or "").translate(_ARABIC_FOLD_TABLE)
+
+
+def _normalize_sql(expr: str) -> str:
+    for src, dst in _ARABIC_FOLD.items():
+        expr = f"replace({expr}, '{src}', '{dst}')"
+    return expr
+
+
+# Compact attendance storage keeps dates as day numbers since 1970-01-01
+_EPOCH = datetime.date(1970, 1, 1)
+
+
+def _day(date: datetime.date) -> int:
+    return (date - _EPOCH).days
+
+
+def _date_of_day(day: int) -> datetime.date:
+    return _EPOCH + datetime.timedelta(days=day)
+
+
+def _sql_day(expr: str) -> str:
+    """SQL converting an ISO date to its day number."""
+    return f"CAST(julianday({expr}) - 2440587.5 AS INTEGER)"
+
+
+def _sql_date(expr: str) -> str:
+    """SQL converting a day number back to an ISO date."""
+    return f"date({expr} + 2440587.5)"
+
+
+_STATUS_SQL = "CASE a.status WHEN 1 THEN 'present' ELSE 'absent' END"
+_SUBJECT_SQL = "(SELECT name FROM subjects WHERE id = a.subject_id)"
+_SUBJECT_ID_SQL = "(SELECT id FROM subjects WHERE name = ?)"
+
+
+# Versioned schema migrations, applied in order and recorded in PRAGMA user_version.
+# Each index matches the WHERE/ORDER BY of a query function below.
+def _move_attendance_to_compact(conn: sqlite3.Connection) -> None:
+    # Only while 'attendance' is still the old table: on a re-run it is already the view
+    kind = conn.execute("SELECT type FROM sqlite_master WHERE name = 'attendance'").fetchone()
+    if kind is None or kind[0] != "table":
+        return
+    conn.execute(
+        f"""
+        INSERT OR REPLACE INTO attendance_compact(student_id, day, subject_id, status)
+        SELECT a.student_id, {_sql_day('a.date')}, sub.id, a.status = 'present'
+        FROM attendance a
+        JOIN subjects sub ON sub.name = COALESCE(a.subject, '')
+        JOIN students s ON s.id = a.student_id
+        """
+    )
+    # Drops the old table's indexes and the summary/version triggers on it
+    conn.execute("DROP TABLE attendance")
+
+
+# A step is an SQL statement, or a function of the connection for one that has to check
+# the schema first
+MIGRATIONS: List[Tuple[int, Tuple[Union[str, Callable[[sqlite3.Connection], None]], ...]]] = [
+    (1, (
+        # get_attendance_report_between_dates / get_attendance_for_date_stage_section
+        "CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance(date, student_id, status, subject)",
+        # get_students_by_stage_section, get_distinct_stages, get_sections_for_stage
+        "CREATE INDEX IF NOT EXISTS idx_students_stage ON students(stage, section, lab, name)",
+        # search_students / get_students_filtered ORDER BY name
+        "CREATE INDEX IF NOT EXISTS idx_students_name ON students(name)",
+        # get_students ORDER BY created_at DESC
+        "CREATE INDEX IF NOT EXISTS idx_students_created_at ON students(created_at)",
+        "ANALYZE",
+    )),
+    (2, (
+        # Per day/group present and absent counts, maintained by the triggers below
+        """
+        CREATE TABLE IF NOT EXISTS attendance_daily_summary (
+            date TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            section TEXT NOT NULL,
+            lab TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            present INTEGER NOT NULL DEFAULT 0,
+            absent INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (date, stage, section, lab, subject)
+        ) WITHOUT ROWID
+        """,
+        "CREATE TABLE IF NOT EXISTS summary_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL) WITHOUT ROWID",
+        """
+        INSERT OR REPLACE INTO attendance_daily_summary(date, stage, section, lab, subject, present, absent)
+        SELECT a.date, s.stage, COALESCE(s.section, ''), COALESCE(s.lab, ''), COALESCE(a.subject, ''),
+               SUM(a.status = 'present'), SUM(a.status = 'absent')
+        FROM attendance a JOIN students s ON s.id = a.student_id
+        GROUP BY 1, 2, 3, 4, 5
+        """,
+        "INSERT OR REPLACE INTO summary_counters(name, value) SELECT 'students', COUNT(*) FROM students",
+        """
+        CREATE TRIGGER IF NOT EXISTS attendance_summary_insert AFTER INSERT ON attendance
+        BEGIN
+            INSERT INTO attendance_daily_summary(date, stage, section, lab, subject, present, absent)
+            SELECT NEW.date, s.stage, COALESCE(s.section, ''), COALESCE(s.lab, ''), COALESCE(NEW.subject, ''),
+                   NEW.status = 'present', NEW.status = 'absent'
+            FROM students s WHERE s.id = NEW.student_id
+            ON CONFLICT(date, stage, section, lab, subject) DO UPDATE
+            SET present = present + excluded.present, absent = absent + excluded.absent;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS attendance_summary_delete AFTER DELETE ON attendance
+        BEGIN
+            UPDATE attendance_daily_summary
+            SET present = present - (OLD.status = 'present'), absent = absent - (OLD.status = 'absent')
+            WHERE date = OLD.date AND subject = COALESCE(OLD.subject, '')
+              AND (stage, section, lab) = (
+                  SELECT stage, COALESCE(section, ''), COALESCE(lab, '') FROM students WHERE id = OLD.student_id
+              );
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS attendance_summary_update AFTER UPDATE OF student_id, date, status, subject ON attendance
+        BEGIN
+            UPDATE attendance_daily_summary
+            SET present = present - (OLD.status = 'present'), absent = absent - (OLD.status = 'absent')
+            WHERE date = OLD.date AND subject = COALESCE(OLD.subject, '')
+              AND (stage, section, lab) = (
+                  SELECT stage, COALESCE(section, ''), COALESCE(lab, '') FROM students WHERE id = OLD.student_id
+              );
+            INSERT INTO attendance_daily_summary(date, stage, section, lab, subject, present, absent)
+            SELECT NEW.date, s.stage, COALESCE(s.section, ''), COALESCE(s.lab, ''), COALESCE(NEW.subject, ''),
+                   NEW.status = 'present', NEW.status = 'absent'
+            FROM students s WHERE s.id = NEW.student_id
+            ON CONFLICT(date, stage, section, lab, subject) DO UPDATE
+            SET present = present + excluded.present, absent = absent + excluded.absent;
+        END
+        """,
+        # Remove a student's attendance while the student row still exists, so the
+        # attendance triggers can find its group before ON DELETE CASCADE would run.
+        """
+        CREATE TRIGGER IF NOT EXISTS students_summary_delete BEFORE DELETE ON students
+        BEGIN
+            DELETE FROM attendance WHERE student_id = OLD.id;
+            UPDATE summary_counters SET value = value - 1 WHERE name = 'students';
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS students_summary_insert AFTER INSERT ON students
+        BEGIN
+            UPDATE summary_counters SET value = value + 1 WHERE name = 'students';
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS students_summary_regroup AFTER UPDATE OF stage, section, lab ON students
+        WHEN (OLD.stage, COALESCE(OLD.section, ''), COALESCE(OLD.lab, ''))
+             <> (NEW.stage, COALESCE(NEW.section, ''), COALESCE(NEW.lab, ''))
+        BEGIN
+            UPDATE attendance_daily_summary
+            SET present = present - x.n_present, absent = absent - x.n_absent
+            FROM (
+                SELECT date AS day, COALESCE(subject, '') AS subj,
+                       SUM(status = 'present') AS n_present, SUM(status = 'absent') AS n_absent
+                FROM attendance WHERE student_id = NEW.id GROUP BY 1, 2
+            ) AS x
+            WHERE date = x.day AND subject = x.subj
+              AND stage = OLD.stage AND section = COALESCE(OLD.section, '') AND lab = COALESCE(OLD.lab, '');
+            INSERT INTO attendance_daily_summary(date, stage, section, lab, subject, present, absent)
+            SELECT date, NEW.stage, COALESCE(NEW.section, ''), COALESCE(NEW.lab, ''), COALESCE(subject, ''),
+                   SUM(status = 'present'), SUM(status = 'absent')
+            FROM attendance WHERE student_id = NEW.id GROUP BY 1, 5
+            ON CONFLICT(date, stage, section, lab, subject) DO UPDATE
+            SET present = present + excluded.present, absent = absent + excluded.absent;
+        END
+        """,
+    )),
+    (3, (
+        """
+        CREATE TABLE IF NOT EXISTS export_jobs (
+            id TEXT PRIMARY KEY,
+            key TEXT NOT NULL,
+            format TEXT NOT NULL,
+            params TEXT NOT NULL,
+            status TEXT NOT NULL CHECK(status IN ('pending','running','done','failed')),
+            rows_done INTEGER NOT NULL DEFAULT 0,
+            rows_total INTEGER,
+            path TEXT,
+            error TEXT,
+            pid INTEGER,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_export_jobs_key ON export_jobs(key, created_at)",
+        # Expiring finished jobs by age
+        "CREATE INDEX IF NOT EXISTS idx_export_jobs_updated ON export_jobs(updated_at)",
+    )),
+    (4, (
+        # Data version stamps for the report cache: one counter per attendance date and
+        # per stage, bumped by triggers whenever rows a report could contain change.
+        "CREATE TABLE IF NOT EXISTS attendance_day_versions (date TEXT PRIMARY KEY, version INTEGER NOT NULL) WITHOUT ROWID",
+        "CREATE TABLE IF NOT EXISTS roster_versions (stage TEXT PRIMARY KEY, version INTEGER NOT NULL) WITHOUT ROWID",
+        """
+        CREATE TRIGGER IF NOT EXISTS attendance_version_insert AFTER INSERT ON attendance
+        BEGIN
+            INSERT INTO attendance_day_versions(date, version) VALUES (NEW.date, 1)
+            ON CONFLICT(date) DO UPDATE SET version = version + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS attendance_version_update AFTER UPDATE ON attendance
+        BEGIN
+            INSERT INTO attendance_day_versions(date, version) VALUES (OLD.date, 1)
+            ON CONFLICT(date) DO UPDATE SET version = version + 1;
+            INSERT INTO attendance_day_versions(date, version) VALUES (NEW.date, 1)
+            ON CONFLICT(date) DO UPDATE SET version = version + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS attendance_version_delete AFTER DELETE ON attendance
+        BEGIN
+            INSERT INTO attendance_day_versions(date, version) VALUES (OLD.date, 1)
+            ON CONFLICT(date) DO UPDATE SET version = version + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS students_version_update AFTER UPDATE ON students
+        BEGIN
+            INSERT INTO roster_versions(stage, version) VALUES (OLD.stage, 1)
+            ON CONFLICT(stage) DO UPDATE SET version = version + 1;
+            INSERT INTO roster_versions(stage, version) VALUES (NEW.stage, 1)
+            ON CONFLICT(stage) DO UPDATE SET version = version + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS students_version_delete AFTER DELETE ON students
+        BEGIN
+            INSERT INTO roster_versions(stage, version) VALUES (OLD.stage, 1)
+            ON CONFLICT(stage) DO UPDATE SET version = version + 1;
+        END
+        """,
+    )),
+    (5, (
+        # Generation counter for the stage/section/lab dropdown cache, shared by all workers
+        "INSERT OR IGNORE INTO summary_counters(name, value) VALUES ('lookups', 0)",
+        """
+        CREATE TRIGGER IF NOT EXISTS students_lookups_insert AFTER INSERT ON students
+        BEGIN
+            UPDATE summary_counters SET value = value + 1 WHERE name = 'lookups';
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS students_lookups_delete AFTER DELETE ON students
+        BEGIN
+            UPDATE summary_counters SET value = value + 1 WHERE name = 'lookups';
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS students_lookups_update AFTER UPDATE OF stage, section, lab ON students
+        BEGIN
+            UPDATE summary_counters SET value = value + 1 WHERE name = 'lookups';
+        END
+        """,
+        # get_distinct_labs
+        "CREATE INDEX IF NOT EXISTS idx_students_lab ON students(lab)",
+    )),
+    (6, (
+        # Name search index: normalized names keyed by students.id, with prefix indexes
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS students_fts USING fts5(
+            name, tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3'
+        )
+        """,
+        # Emptied first so a re-run backfills instead of colliding with the rows it left
+        "DELETE FROM students_fts",
+        f"INSERT INTO students_fts(rowid, name) SELECT id, {_normalize_sql('name')} FROM students",
+        f"""
+        CREATE TRIGGER IF NOT EXISTS students_fts_insert AFTER INSERT ON students
+        BEGIN
+            INSERT INTO students_fts(rowid, name) VALUES (NEW.id, {_normalize_sql('NEW.name')});
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS students_fts_delete AFTER DELETE ON students
+        BEGIN
+            DELETE FROM students_fts WHERE rowid = OLD.id;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS students_fts_update AFTER UPDATE OF name ON students
+        BEGIN
+            UPDATE students_fts SET name = {_normalize_sql('NEW.name')} WHERE rowid = NEW.id;
+        END
+        """,
+    )),
+    (7, (
+        # Compact attendance: subjects by id, day numbers, status 1 (present) / 0 (absent),
+        # clustered on (student_id, day, subject_id). 'attendance' becomes a view with the
+        # old columns, writable through INSTEAD OF triggers.
+        "CREATE TABLE IF NOT EXISTS subjects (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)",
+        "INSERT OR IGNORE INTO subjects(name) SELECT DISTINCT COALESCE(subject, '') FROM attendance ORDER BY 1",
+        """
+        CREATE TABLE IF NOT EXISTS attendance_compact (
+            student_id INTEGER NOT NULL REFERENCES students(id) ON DELETE CASCADE,
+            day INTEGER NOT NULL,
+            subject_id INTEGER NOT NULL REFERENCES subjects(id),
+            status INTEGER NOT NULL CHECK(status IN (0, 1)),
+            PRIMARY KEY (student_id, day, subject_id)
+        ) WITHOUT ROWID
+        """,
+        _move_attendance_to_compact,
+        # Report queries: rows of a date range, covering the status as well
+        "CREATE INDEX IF NOT EXISTS idx_attendance_compact_day ON attendance_compact(day, status)",
+        f"""
+        CREATE VIEW IF NOT EXISTS attendance AS
+        SELECT a.student_id, {_sql_date('a.day')} AS date, {_STATUS_SQL} AS status, sub.name AS subject
+        FROM attendance_compact a JOIN subjects sub ON sub.id = a.subject_id
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_view_insert INSTEAD OF INSERT ON attendance
+        BEGIN
+            SELECT RAISE(ABORT, 'invalid status') WHERE NEW.status NOT IN ('present', 'absent');
+            INSERT INTO subjects(name) VALUES (COALESCE(NEW.subject, '')) ON CONFLICT(name) DO NOTHING;
+            INSERT INTO attendance_compact(student_id, day, subject_id, status)
+            SELECT NEW.student_id, {_sql_day('NEW.date')}, id, NEW.status = 'present'
+            FROM subjects WHERE name = COALESCE(NEW.subject, '')
+            ON CONFLICT(student_id, day, subject_id) DO UPDATE SET status = excluded.status;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_view_update INSTEAD OF UPDATE ON attendance
+        BEGIN
+            SELECT RAISE(ABORT, 'invalid status') WHERE NEW.status NOT IN ('present', 'absent');
+            DELETE FROM attendance_compact
+            WHERE student_id = OLD.student_id AND day = {_sql_day('OLD.date')}
+              AND subject_id = (SELECT id FROM subjects WHERE name = OLD.subject);
+            INSERT INTO subjects(name) VALUES (COALESCE(NEW.subject, '')) ON CONFLICT(name) DO NOTHING;
+            INSERT INTO attendance_compact(student_id, day, subject_id, status)
+            SELECT NEW.student_id, {_sql_day('NEW.date')}, id, NEW.status = 'present'
+            FROM subjects WHERE name = COALESCE(NEW.subject, '')
+            ON CONFLICT(student_id, day, subject_id) DO UPDATE SET status = excluded.status;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_view_delete INSTEAD OF DELETE ON attendance
+        BEGIN
+            DELETE FROM attendance_compact
+            WHERE student_id = OLD.student_id AND day = {_sql_day('OLD.date')}
+              AND subject_id = (SELECT id FROM subjects WHERE name = OLD.subject);
+        END
+        """,
+        # Summary and version triggers from migrations 2 and 4, moved to the new table
+        f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_summary_insert AFTER INSERT ON attendance_compact
+        BEGIN
+            INSERT INTO attendance_daily_summary(date, stage, section, lab, subject, present, absent)
+            SELECT {_sql_date('NEW.day')}, s.stage, COALESCE(s.section, ''), COALESCE(s.lab, ''), sub.name,
+                   NEW.status = 1, NEW.status = 0
+            FROM students s, subjects sub WHERE s.id = NEW.student_id AND sub.id = NEW.subject_id
+            ON CONFLICT(date, stage, section, lab, subject) DO UPDATE
+            SET present = present + excluded.present, absent = absent + excluded.absent;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_summary_delete AFTER DELETE ON attendance_compact
+        BEGIN
+            UPDATE attendance_daily_summary
+            SET present = present - (OLD.status = 1), absent = absent - (OLD.status = 0)
+            WHERE date = {_sql_date('OLD.day')} AND subject = (SELECT name FROM subjects WHERE id = OLD.subject_id)
+              AND (stage, section, lab) = (
+                  SELECT stage, COALESCE(section, ''), COALESCE(lab, '') FROM students WHERE id = OLD.student_id
+              );
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_summary_update AFTER UPDATE ON attendance_compact
+        BEGIN
+            UPDATE attendance_daily_summary
+            SET present = present - (OLD.status = 1), absent = absent - (OLD.status = 0)
+            WHERE date = {_sql_date('OLD.day')} AND subject = (SELECT name FROM subjects WHERE id = OLD.subject_id)
+              AND (stage, section, lab) = (
+                  SELECT stage, COALESCE(section, ''), COALESCE(lab, '') FROM students WHERE id = OLD.student_id
+              );
+            INSERT INTO attendance_daily_summary(date, stage, section, lab, subject, present, absent)
+            SELECT {_sql_date('NEW.day')}, s.stage, COALESCE(s.section, ''), COALESCE(s.lab, ''), sub.name,
+                   NEW.status = 1, NEW.status = 0
+            FROM students s, subjects sub WHERE s.id = NEW.student_id AND sub.id = NEW.subject_id
+            ON CONFLICT(date, stage, section, lab, subject) DO UPDATE
+            SET present = present + excluded.present, absent = absent + excluded.absent;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_version_insert AFTER INSERT ON attendance_compact
+        BEGIN
+            INSERT INTO attendance_day_versions(date, version) VALUES ({_sql_date('NEW.day')}, 1)
+            ON CONFLICT(date) DO UPDATE SET version = version + 1;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_version_update AFTER UPDATE ON attendance_compact
+        BEGIN
+            INSERT INTO attendance_day_versions(date, version) VALUES ({_sql_date('OLD.day')}, 1)
+            ON CONFLICT(date) DO UPDATE SET version = version + 1;
+            INSERT INTO attendance_day_versions(date, version) VALUES ({_sql_date('NEW.day')}, 1)
+            ON CONFLICT(date) DO UPDATE SET version = version + 1;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS attendance_version_delete AFTER DELETE ON attendance_compact
+        BEGIN
+            INSERT INTO attendance_day_versions(date, version) VALUES ({_sql_date('OLD.day')}, 1)
+            ON CONFLICT(date) DO UPDATE SET version = version + 1;
+        END
+        """,
+        "DROP TRIGGER IF EXISTS students_summary_delete",
+        """
+        CREATE TRIGGER IF NOT EXISTS students_summary_delete BEFORE DELETE ON students
+        BEGIN
+            DELETE FROM attendance_compact WHERE student_id = OLD.id;
+            UPDATE summary_counters SET value = value - 1 WHERE name = 'students';
+        END
+        """,
+        "DROP TRIGGER IF EXISTS students_summary_regroup",
+        f"""
+        CREATE TRIGGER IF NOT EXISTS students_summary_regroup AFTER UPDATE OF stage, section, lab ON students
+        WHEN (OLD.stage, COALESCE(OLD.section, ''), COALESCE(OLD.lab, ''))
+             <> (NEW.stage, COALESCE(NEW.section, ''), COALESCE(NEW.lab, ''))
+        BEGIN
+            UPDATE attendance_daily_summary
+            SET present = present - x.n_present, absent = absent - x.n_absent
+            FROM (
+                SELECT {_sql_date('a.day')} AS d, sub.name AS subj,
+                       SUM(a.status = 1) AS n_present, SUM(a.status = 0) AS n_absent
+                FROM attendance_compact a JOIN subjects sub ON sub.id = a.subject_id
+                WHERE a.student_id = NEW.id GROUP BY a.day, a.subject_id
+            ) AS x
+            WHERE date = x.d AND subject = x.subj
+              AND stage = OLD.stage AND section = COALESCE(OLD.section, '') AND lab = COALESCE(OLD.lab, '');
+            INSERT INTO attendance_daily_summary(date, stage, section, lab, subject, present, absent)
+            SELECT {_sql_date('a.day')}, NEW.stage, COALESCE(NEW.section, ''), COALESCE(NEW.lab, ''), sub.name,
+                   SUM(a.status = 1), SUM(a.status = 0)
+            FROM attendance_compact a JOIN subjects sub ON sub.id = a.subject_id
+            WHERE a.student_id = NEW.id GROUP BY a.day, a.subject_id
+            ON CONFLICT(date, stage, section, lab, subject) DO UPDATE
+            SET present = present + excluded.present, absent = absent + excluded.absent;
+        END
+        """,
+        "ANALYZE",
+    )),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def _apply_migrations(conn: sqlite3.Connection) -> None:
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        with conn:
+            # IMMEDIATE takes the write lock before the version is read again, so when several
+            # processes start together each step runs in exactly one of them
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                continue
+            for stmt in statements:
+                if callable(stmt):
+                    stmt(conn)
+                else:
+                    conn.execute(stmt)
+            conn.execute(f"PRAGMA user_version={version}")
+
+
+def academic_year_start(date: datetime.date) -> datetime.date:
+    year = date.year if date.month >= ACADEMIC_YEAR_START_MONTH else date.year - 1
+    return datetime.date(year, ACADEMIC_YEAR_START_MONTH, 1)
+
+
+def _year_days(year: int) -> Tuple[int, int]:
+    """First and last day number of the academic year starting in `year`."""
+    start = datetime.date(year, ACADEMIC_YEAR_START_MONTH, 1)
+    return _day(start), _day(start.replace(year=year + 1)) - 1
+
+
+def archive_path(year: int) -> Path:
+    return ARCHIVE_DIR / f"attendance_{year}.db"
+
+
+def archived_years() -> List[int]:
+    try:
+        names = os.listdir(ARCHIVE_DIR)
+    except FileNotFoundError:
+        return []
+    years = []
+    for name in names:
+        stem, ext = os.path.splitext(name)
+        if ext == ".db" and stem.startswith("attendance_") and stem[len("attendance_"):].isdigit():
+            years.append(int(stem[len("attendance_"):]))
+    return sorted(years)
+
+
+def _attach_archives(conn: sqlite3.Connection, years: Sequence[int]) -> List[str]:
+    """
+    ATTACH the archives of `years` to this connection (once each) and return their schema
+    names. When that would pass SQLite's limit on attached databases, archives that these
+    years do not need are detached first; the ones being returned never are.
+    """
+    schemas = [f"archive_{year}" for year in years]
+    limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    if len(schemas) > limit:
+        raise sqlite3.OperationalError(f"{len(schemas)} archived years in one query, SQLite attaches at most {limit}")
+    attached = [r[1] for r in conn.execute("PRAGMA database_list").fetchall() if r[1].startswith("archive_")]
+    missing = [(year, schema) for year, schema in zip(years, schemas) if schema not in attached]
+    excess = len(attached) + len(missing) - limit
+    for name in [name for name in attached if name not in schemas][:max(excess, 0)]:
+        try:
+            conn.execute(f"DETACH DATABASE {name}")
+        except sqlite3.OperationalError:
+            pass  # still used by an open cursor
+    for year, schema in missing:
+        conn.execute(f"ATTACH DATABASE ? AS {schema}", (str(archive_path(year)),))
+    return schemas
+
+
+def _attach_archive(conn: sqlite3.Connection, year: int) -> str:
+    return _attach_archives(conn, [year])[0]
+
+
+def _partitions(
+    start_date: Optional[datetime.date] = None, end_date: Optional[datetime.date] = None, newest_first: bool = False
+) -> List[Tuple[str, int, int]]:
+    """
+    (schema, first day, last day) for every attendance partition overlapping the range,
+    oldest first: the archives of closed years, then main. Only those archives are attached.
+    Main is always included because rows written for a closed year stay there until the
+    next rollover.
+    """
+    start_day = _day(start_date) if start_date else -(2 ** 31)
+    end_day = _day(end_date) if end_date else 2 ** 31
+    years = []
+    for year in archived_years():
+        first, last = _year_days(year)
+        if first <= end_day and last >= start_day:
+            years.append((year, max(first, start_day), min(last, end_day)))
+    # Attach them together so making room for one never detaches another
+    schemas = _attach_archives(get_conn(), [year for year, _, _ in years])
+    parts = [(schema, first, last) for schema, (_, first, last) in zip(schemas, years)]
+    parts.append(("main", start_day, end_day))
+    return parts[::-1] if newest_first else parts
+
+
+def archive_closed_years(today: Optional[datetime.date] = None) -> List[Tuple[int, int]]:
+    """
+    Move attendance from academic years that ended before today's into per-year archive
+    databases under ARCHIVE_DIR, keeping their dashboard summaries. Safe to re-run: rows
+    already archived are replaced. Returns (year, rows moved) pairs.
+    """
+    current = academic_year_start(today or datetime.date.today())
+    conn = get_conn()
+    oldest = conn.execute("SELECT MIN(day) FROM main.attendance_compact WHERE day < ?", (_day(current),)).fetchone()[0]
+    if oldest is None:
+        return []
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    moved = []
+    for year in range(academic_year_start(_date_of_day(oldest)).year, current.year):
+        first, last = _year_days(year)
+        dates = (_date_of_day(first).isoformat(), _date_of_day(last).isoformat())
+        schema = _attach_archive(conn, year)
+        with conn:
+            conn.execute("BEGIN")
+            conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {schema}.attendance_compact (
+                    student_id INTEGER NOT NULL,
+                    day INTEGER NOT NULL,
+                    subject_id INTEGER NOT NULL,
+                    status INTEGER NOT NULL CHECK(status IN (0, 1)),
+                    PRIMARY KEY (student_id, day, subject_id)
+                ) WITHOUT ROWID
+                """
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_attendance_compact_day ON attendance_compact(day, status)")
+            count = conn.execute(
+                f"""
+                INSERT OR REPLACE INTO {schema}.attendance_compact(student_id, day, subject_id, status)
+                SELECT student_id, day, subject_id, status FROM main.attendance_compact WHERE day BETWEEN ? AND ?
+                """,
+                (first, last),
+            ).rowcount
+            # The delete triggers would zero these days in the dashboard summary; put them back
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS archived_summary AS SELECT * FROM attendance_daily_summary WHERE 0")
+            conn.execute("DELETE FROM temp.archived_summary")
+            conn.execute(
+                "INSERT INTO temp.archived_summary SELECT * FROM attendance_daily_summary WHERE date BETWEEN ? AND ?", dates
+            )
+            conn.execute("DELETE FROM main.attendance_compact WHERE day BETWEEN ? AND ?", (first, last))
+            conn.execute("INSERT OR REPLACE INTO attendance_daily_summary SELECT * FROM temp.archived_summary")
+        conn.execute(f"ANALYZE {schema}")
+        if count:
+            moved.append((year, count))
+    return moved
 
 
 def add_student(name: str, exam_number: str, stage: str, section: str = "", lab: str = "") -> Tuple[bool, str]:
@@ -74,11 +780,23 @@ def add_student(name: str, exam_number: str, stage: str, section: str = "", lab:
                 "INSERT INTO students(name, exam_number, stage, section, lab, created_at) VALUES (?,?,?,?,?,?)",
                 (name, exam_number, stage, section, lab, created_at),
             )
+        invalidate_lookups()
         return True, ""
     except sqlite3.IntegrityError:
         return False, "الرقم الامتحاني موجود مسبقاً."
 
 
+def get_dashboard_counts(date: datetime.date) -> Tuple[int, int, int]:
+    """(total students, present, absent) for a date, read from the maintained summary tables."""
+    with get_conn() as conn:
+        total = conn.execute("SELECT value FROM summary_counters WHERE name = 'students'").fetchone()
+        row = conn.execute(
+            "SELECT COALESCE(SUM(present), 0), COALESCE(SUM(absent), 0) FROM attendance_daily_summary WHERE date = ?",
+            (date.isoformat(),),
+        ).fetchone()
+    return (int(total[0]) if total else 0), int(row[0]), int(row[1])
+
+
 def get_students() -> List[dict]:
     with get_conn() as conn:
         rows = conn.execute(
@@ -87,21 +805,54 @@ def get_students() -> List[dict]:
         return [dict(r) for r in rows]
 
 
-def search_students(name_contains: str = "", exam_number: str = "", lab: Optional[str] = None) -> List[dict]:
-    name_like = f"%{name_contains}%" if name_contains else None
+def _name_match(text: str) -> Optional[str]:
+    """FTS5 query matching every word of text as a normalized prefix, or None if it has no words."""
+    # The tokenizer drops punctuation, so a word without letters or digits matches nothing
+    words = [w for w in normalize_arabic(text).split() if any(ch.isalnum() for ch in w)]
+    if not words:
+        return None
+    return " AND ".join('"' + w.replace('"', '""') + '"*' for w in words)
+
+
+def _students_query(
+    columns: str, name_contains: str, where: List[str], params: List[object], limit: Optional[int] = None
+) -> Tuple[str, List[object]]:
+    """
+    SELECT over students filtered by where/params, ordered by name. A name filter keeps
+    the ids students_fts matches and sorts only those by name (no bm25 ranking of every
+    match); a filter with no words is ignored.
+    """
+    match = _name_match(name_contains) if name_contains else None
+    if match:
+        where = ["s.id IN (SELECT rowid FROM students_fts WHERE students_fts MATCH ?)"] + where
+        params = [match] + params
+    sql = f"SELECT {columns} FROM students s"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY s.name"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params = params + [limit]
+    return sql, params
+
+
+def search_students(
+    name_contains: str = "", exam_number: str = "", lab: Optional[str] = None, limit: Optional[int] = None
+) -> List[dict]:
+    where = []
+    params: List[object] = []
+    if exam_number:
+        where.append("s.exam_number = ?"); params.append(exam_number)
+    if lab:
+        where.append("s.lab = ?"); params.append(lab)
+    sql, params = _students_query(
+        "s.id, s.name, s.exam_number, s.stage, s.section, s.lab",
+        "" if exam_number else name_contains,
+        where,
+        params,
+        limit,
+    )
     with get_conn() as conn:
-        where = []
-        params: List[object] = []
-        if exam_number:
-            where.append("exam_number = ?"); params.append(exam_number)
-        if name_like is not None and not exam_number:
-            where.append("name LIKE ?"); params.append(name_like)
-        if lab:
-            where.append("lab = ?"); params.append(lab)
-        sql = "SELECT id, name, exam_number, stage, section, lab FROM students"
-        if where:
-            sql += " WHERE " + " AND ".join(where)
-        sql += " ORDER BY name"
         rows = conn.execute(sql, params).fetchall()
         return [dict(r) for r in rows]
 
@@ -116,28 +867,163 @@ def upsert_attendance_for_date(exam_number: str, date: datetime.date, status: st
     student_id = get_student_id_by_exam(exam_number)
     if student_id is None:
         return False
-    date_str = date.isoformat()
-    with get_conn() as conn:
+    day = _day(date)
+    conn = get_conn()
+    archive = _archive_for_day(conn, day)
+    with conn:
+        subject_id = _subject_id(conn, subject)
+        if archive:
+            _unarchive(conn, archive, day, subject_id, [student_id])
         conn.execute(
             """
-            INSERT INTO attendance(student_id, date, status, subject)
+            INSERT INTO attendance_compact(student_id, day, subject_id, status)
             VALUES (?,?,?,?)
-            ON CONFLICT(student_id, date, COALESCE(subject, '')) DO UPDATE SET status=excluded.status
+            ON CONFLICT(student_id, day, subject_id) DO UPDATE SET status=excluded.status
+            WHERE status != excluded.status
             """,
-            (student_id, date_str, status, subject),
+            (student_id, day, subject_id, int(status == "present")),
         )
     return True
 
 
-def get_attendance_for_date_stage_section(
+def archived_year(date: datetime.date) -> Optional[int]:
+    """The academic year holding `date` if it has been moved to an archive, else None."""
+    year = academic_year_start(date).year
+    return year if archive_path(year).exists() else None
+
+
+def _archive_for_day(conn: sqlite3.Connection, day: int) -> Optional[str]:
+    # ATTACH is refused inside a transaction, so writers call this before their first statement
+    year = archived_year(_date_of_day(day))
+    return _attach_archive(conn, year) if year is not None else None
+
+
+def _uncount_archived(conn: sqlite3.Connection, schema: str, match: str, params: tuple) -> None:
+    """Take the archived rows matching `match` (on alias a) out of the dashboard summary."""
+    conn.execute(
+        f"""
+        UPDATE attendance_daily_summary
+        SET present = present - x.n_present, absent = absent - x.n_absent
+        FROM (
+            SELECT a.day AS a_day, a.subject_id AS a_subject_id,
+                   s.stage AS s_stage, COALESCE(s.section, '') AS s_section, COALESCE(s.lab, '') AS s_lab,
+                   SUM(a.status = 1) AS n_present, SUM(a.status = 0) AS n_absent
+            FROM {schema}.attendance_compact a JOIN students s ON s.id = a.student_id
+            WHERE {match}
+            GROUP BY 1, 2, 3, 4, 5
+        ) AS x
+        WHERE date = {_sql_date('x.a_day')} AND subject = (SELECT name FROM subjects WHERE id = x.a_subject_id)
+          AND stage = x.s_stage AND section = x.s_section AND lab = x.s_lab
+        """,
+        params,
+    )
+
+
+def _unarchive(conn: sqlite3.Connection, schema: str, day: int, subject_id: int, student_ids: List[int]) -> None:
+    """
+    Move the archived rows about to be rewritten back into main, so correcting a closed year
+    replaces its row instead of adding a second one next to it. The rollover kept those rows
+    in the dashboard summary and main's insert trigger counts them again, so they are taken
+    out of it first.
+    """
+    match = "a.day = ? AND a.subject_id = ? AND a.student_id IN (SELECT value FROM json_each(?))"
+    params = (day, subject_id, json.dumps(student_ids))
+    _uncount_archived(conn, schema, match, params)
+    conn.execute(
+        f"""
+        INSERT INTO main.attendance_compact(student_id, day, subject_id, status)
+        SELECT a.student_id, a.day, a.subject_id, a.status FROM {schema}.attendance_compact a WHERE {match}
+        ON CONFLICT(student_id, day, subject_id) DO NOTHING
+        """,
+        params,
+    )
+    conn.execute(f"DELETE FROM {schema}.attendance_compact AS a WHERE {match}", params)
+
+
+def _subject_id(conn: sqlite3.Connection, subject: Optional[str]) -> int:
+    """Id of a subject name in the subjects lookup table, adding it on first use."""
+    name = subject or ""
+    conn.execute("INSERT INTO subjects(name) VALUES (?) ON CONFLICT(name) DO NOTHING", (name,))
+    return int(conn.execute("SELECT id FROM subjects WHERE name = ?", (name,)).fetchone()[0])
+
+
+def upsert_attendance_bulk(
     date: datetime.date,
-    stage: Optional[str] = None,
-    section: Optional[str] = None,
-    lab: Optional[str] = None,
-    subject: Optional[str] = None,
-) -> pd.DataFrame:
-    params: List[object] = [date.isoformat()]
-    where = ["a.date = ?"]
+    entries: Iterable[Tuple[str, str]],
+    subject: str = "",
+) -> Tuple[int, List[Tuple[str, str]]]:
+    """
+    Save many (exam_number, status) pairs for one date/subject in a single transaction.
+    Returns (saved_count, failures) where failures is a list of (exam_number, reason);
+    saved_count counts only rows that were added or changed.
+    """
+    entries = list(entries)
+    if not entries:
+        return 0, []
+    with get_conn() as conn:
+        return apply_attendance_bulk(conn, date, entries, subject)
+
+
+def apply_attendance_bulk(
+    conn: sqlite3.Connection,
+    date: datetime.date,
+    entries: Iterable[Tuple[str, str]],
+    subject: str = "",
+) -> Tuple[int, List[Tuple[str, str]]]:
+    """
+    The statements of upsert_attendance_bulk, run inside the caller's transaction on `conn`
+    (the group-commit writer in write_queue.py merges several of these into one commit).
+    A date in an archived year needs its archive attached before that transaction began.
+    """
+    entries = [(str(exam_number), status) for exam_number, status in entries]
+    failures: List[Tuple[str, str]] = []
+    if not entries:
+        return 0, failures
+    day = _day(date)
+    archive = _archive_for_day(conn, day)
+    subject_id = _subject_id(conn, subject)
+    # Resolve every student id with one query instead of one lookup per row
+    exam_numbers = sorted({exam_number for exam_number, _ in entries})
+    rows = conn.execute(
+        "SELECT id, exam_number FROM students WHERE exam_number IN (SELECT value FROM json_each(?))",
+        (json.dumps(exam_numbers),),
+    ).fetchall()
+    ids = {r["exam_number"]: int(r["id"]) for r in rows}
+
+    params = []
+    for exam_number, status in entries:
+        if status not in ("present", "absent"):
+            failures.append((exam_number, "حالة غير صالحة."))
+            continue
+        student_id = ids.get(exam_number)
+        if student_id is None:
+            failures.append((exam_number, "الطالب غير موجود."))
+            continue
+        params.append((student_id, day, subject_id, int(status == "present")))
+    if archive and params:
+        _unarchive(conn, archive, day, subject_id, [p[0] for p in params])
+    # Rows whose status is unchanged are left alone: no page is dirtied for them
+    cur = conn.executemany(
+        """
+        INSERT INTO attendance_compact(student_id, day, subject_id, status)
+        VALUES (?,?,?,?)
+        ON CONFLICT(student_id, day, subject_id) DO UPDATE SET status=excluded.status
+        WHERE status != excluded.status
+        """,
+        params,
+    )
+    return max(cur.rowcount, 0), failures
+
+
+def _day_sheet_filters(
+    date: datetime.date,
+    stage: Optional[str],
+    section: Optional[str],
+    lab: Optional[str],
+    subject: Optional[str],
+) -> Tuple[List[str], List[object]]:
+    params: List[object] = [_day(date)]
+    where = ["a.day = ?"]
     if stage:
         where.append("s.stage = ?")
         params.append(stage)
@@ -148,19 +1034,74 @@ def get_attendance_for_date_stage_section(
         where.append("(s.lab = ?)")
         params.append(lab)
     if subject:
-        where.append("(COALESCE(a.subject, '') = ?)")
+        where.append(f"(a.subject_id = {_SUBJECT_ID_SQL})")
         params.append(subject)
+    return where, params
 
-    sql = f"""
-        SELECT a.date, a.status, a.subject, s.name, s.exam_number, s.stage, s.section, s.lab
-        FROM attendance a
-        JOIN students s ON s.id = a.student_id
-        WHERE {' AND '.join(where)}
-        ORDER BY s.stage, s.section, s.lab, s.name
+
+def get_attendance_for_date_stage_section(
+    date: datetime.date,
+    stage: Optional[str] = None,
+    section: Optional[str] = None,
+    lab: Optional[str] = None,
+    subject: Optional[str] = None,
+) -> pd.DataFrame:
+    where, params = _day_sheet_filters(date, stage, section, lab, subject)
+    frames = []
+    for schema, _, _ in _partitions(date, date):
+        sql = f"""
+            SELECT {_sql_date('a.day')} AS date, {_STATUS_SQL} AS status, {_SUBJECT_SQL} AS subject,
+                   s.name, s.exam_number, s.stage, s.section, s.lab
+            FROM {schema}.attendance_compact a
+            JOIN students s ON s.id = a.student_id
+            WHERE {' AND '.join(where)}
+            ORDER BY s.stage, s.section, s.lab, s.name
+        """
+        frames.append(_read_frame(sql, get_conn(), params=params))
+    return _concat(frames)
+
+
+def get_attendance_statuses(
+    date: datetime.date,
+    stage: Optional[str] = None,
+    section: Optional[str] = None,
+    lab: Optional[str] = None,
+    subject: Optional[str] = None,
+) -> dict:
     """
-    with get_conn() as conn:
-        df = pd.read_sql_query(sql, conn, params=params)
-        return df
+    {exam_number: "present"/"absent"} for one day, filtered like
+    get_attendance_for_date_stage_section: the attendance form's prefill, read straight
+    off the cursor without building a frame.
+    """
+    where, params = _day_sheet_filters(date, stage, section, lab, subject)
+    statuses = {}
+    for schema, _, _ in _partitions(date, date):
+        rows = get_conn().execute(
+            f"""
+            SELECT s.exam_number, a.status
+            FROM {schema}.attendance_compact a
+            JOIN students s ON s.id = a.student_id
+            WHERE {' AND '.join(where)}
+            """,
+            params,
+        )
+        for exam_number, status in rows:
+            statuses[str(exam_number)] = "present" if status else "absent"
+    return statuses
+
+
+def _read_frame(sql: str, conn: sqlite3.Connection, **kwargs) -> pd.DataFrame:
+    import pandas as pd
+
+    with metrics.library("pandas"):
+        return pd.read_sql_query(sql, conn, **kwargs)
+
+
+def _concat(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    import pandas as pd
+
+    frames = [f for f in frames if not f.empty] or frames[-1:]
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
 
 
 def get_students_by_stage_section(stage: Optional[str], section: Optional[str], lab: Optional[str] = None) -> pd.DataFrame:
@@ -180,34 +1121,118 @@ def get_students_by_stage_section(stage: Optional[str], section: Optional[str],
         sql += " WHERE " + " AND ".join(where)
     sql += " ORDER BY name"
     with get_conn() as conn:
-        return pd.read_sql_query(sql, conn, params=params)
+        return _read_frame(sql, conn, params=params)
 
 
 def get_attendance_by_student(exam_number: str) -> List[dict]:
-    with get_conn() as conn:
-        rows = conn.execute(
-            """
-            SELECT a.date, a.status, a.subject
-            FROM attendance a
+    rows = []
+    for schema, _, _ in _partitions(newest_first=True):
+        rows += get_conn().execute(
+            f"""
+            SELECT {_sql_date('a.day')} AS date, {_STATUS_SQL} AS status, {_SUBJECT_SQL} AS subject
+            FROM {schema}.attendance_compact a
             JOIN students s ON s.id = a.student_id
             WHERE s.exam_number = ?
-            ORDER BY a.date DESC
+            ORDER BY a.day DESC
             """,
             (exam_number,),
         ).fetchall()
-        return [dict(r) for r in rows]
+    return [dict(r) for r in rows]
 
 
-def get_attendance_report_between_dates(
-    start_date: datetime.date,
-    end_date: datetime.date,
+def get_attendance_page_for_student(
+    exam_number: str, after: Optional[Sequence[str]] = None, page_size: int = 50
+) -> Tuple[Optional[List[dict]], Optional[List[str]]]:
+    """
+    One page of a student's attendance, newest first. after is the key of the
+    last row of the previous page, as (day, subject_id). Returns (None, None) for an unknown exam number.
+    """
+    student_id = get_student_id_by_exam(exam_number)
+    if student_id is None:
+        return None, None
+    if not (after and len(after) == 2 and all(isinstance(v, int) for v in after)):
+        after = None
+    rows: List[sqlite3.Row] = []
+    for schema, _, _ in _partitions(newest_first=True):
+        sql = f"""
+            SELECT {_sql_date('a.day')} AS date, {_SUBJECT_SQL} AS subject, {_STATUS_SQL} AS status, a.day, a.subject_id
+            FROM {schema}.attendance_compact a
+            WHERE a.student_id = ?
+        """
+        params: List[object] = [student_id]
+        if after:
+            sql += " AND (a.day, a.subject_id) < (?, ?)"
+            params += list(after)
+        sql += " ORDER BY a.day DESC, a.subject_id DESC LIMIT ?"
+        params.append(page_size + 1 - len(rows))
+        rows += get_conn().execute(sql, params).fetchall()
+        if len(rows) > page_size:
+            break
+    page = [{"date": r["date"], "subject": r["subject"], "status": r["status"]} for r in rows[:page_size]]
+    if len(rows) <= page_size:
+        return page, None
+    return page, [rows[page_size - 1]["day"], rows[page_size - 1]["subject_id"]]
+
+
+def autocomplete_students(
+    prefix: str, after: Optional[Sequence[object]] = None, limit: int = 10
+) -> Tuple[List[dict], Optional[List[object]]]:
+    """
+    Top matches for a name or exam-number prefix, with only the columns a picker needs.
+    Input containing a digit is treated as an exam number and paged by exam_number;
+    otherwise names are matched through students_fts and paged by (name, id).
+    Returns (rows, next_key).
+    """
+    columns = "s.name, s.exam_number, s.stage, s.section, s.lab"
+    by_exam = any(ch.isdigit() for ch in prefix)
+    if by_exam:
+        sql = f"SELECT {columns} FROM students s WHERE s.exam_number >= ? AND s.exam_number < ?"
+        params: List[object] = [prefix, prefix + "\U0010ffff"]
+        if after:
+            sql += " AND s.exam_number > ?"
+            params.append(str(after[0]))
+        sql += " ORDER BY s.exam_number LIMIT ?"
+        params.append(limit + 1)
+    else:
+        match = _name_match(prefix)
+        if not match:
+            return [], None
+        sql = (
+            f"SELECT {columns}, s.id FROM students s"
+            " WHERE s.id IN (SELECT rowid FROM students_fts WHERE students_fts MATCH ?)"
+        )
+        params = [match]
+        # A key from another kind of page (or an old offset cursor) restarts from the top
+        if after and len(after) == 2 and isinstance(after[0], str) and isinstance(after[1], int):
+            sql += " AND (s.name, s.id) > (?, ?)"
+            params += list(after)
+        sql += " ORDER BY s.name, s.id LIMIT ?"
+        params.append(limit + 1)
+    with get_conn() as conn:
+        rows = [dict(r) for r in conn.execute(sql, params).fetchall()]
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if by_exam:
+        return rows, [rows[-1]["exam_number"]] if more else None
+    next_key = [rows[-1]["name"], rows[-1]["id"]] if more else None
+    for row in rows:
+        del row["id"]
+    return rows, next_key
+
+
+REPORT_COLUMNS = ["date", "subject", "name", "exam_number", "stage", "section", "lab", "status"]
+
+
+def _report_where(
+    start_day: int,
+    end_day: int,
     stage: Optional[str] = None,
     section: Optional[str] = None,
     lab: Optional[str] = None,
     subject: Optional[str] = None,
-) -> pd.DataFrame:
-    params: List[object] = [start_date.isoformat(), end_date.isoformat()]
-    where = ["a.date BETWEEN ? AND ?"]
+) -> Tuple[str, List[object]]:
+    params: List[object] = [start_day, end_day]
+    where = ["a.day BETWEEN ? AND ?"]
     if stage:
         where.append("s.stage = ?")
         params.append(stage)
@@ -218,23 +1243,319 @@ def get_attendance_report_between_dates(
         where.append("(s.lab = ?)")
         params.append(lab)
     if subject:
-        where.append("(COALESCE(a.subject, '') = ?)")
+        where.append(f"(a.subject_id = {_SUBJECT_ID_SQL})")
         params.append(subject)
-    sql = f"""
-        SELECT a.date, a.subject, s.name, s.exam_number, s.stage, s.section, s.lab, a.status
-        FROM attendance a
-        JOIN students s ON s.id = a.student_id
-        WHERE {' AND '.join(where)}
-        ORDER BY a.date, s.stage, s.section, s.lab, s.name
+    return " AND ".join(where), params
+
+
+# Report rows in REPORT_COLUMNS order, read from the compact attendance table
+_REPORT_SELECT = f"""
+    SELECT {_sql_date('a.day')} AS date, {_SUBJECT_SQL} AS subject, s.name, s.exam_number, s.stage, s.section, s.lab,
+           {_STATUS_SQL} AS status
+"""
+_REPORT_FROM = "FROM {schema}.attendance_compact a JOIN students s ON s.id = a.student_id"
+
+
+def _report_queries(
+    start_date: datetime.date,
+    end_date: datetime.date,
+    stage: Optional[str] = None,
+    section: Optional[str] = None,
+    lab: Optional[str] = None,
+    subject: Optional[str] = None,
+) -> List[Tuple[str, List[object]]]:
+    """The report query for each partition overlapping the range, in date order."""
+    queries = []
+    for schema, start_day, end_day in _partitions(start_date, end_date):
+        where, params = _report_where(start_day, end_day, stage, section, lab, subject)
+        sql = f"""
+            {_REPORT_SELECT}
+            {_REPORT_FROM.format(schema=schema)}
+            WHERE {where}
+            ORDER BY a.day, s.stage, s.section, s.lab, s.name
+        """
+        queries.append((sql, params))
+    return queries
+
+
+def get_attendance_report_between_dates(
+    start_date: datetime.date,
+    end_date: datetime.date,
+    stage: Optional[str] = None,
+    section: Optional[str] = None,
+    lab: Optional[str] = None,
+    subject: Optional[str] = None,
+) -> pd.DataFrame:
+    conn = get_conn()
+    return _concat([
+        _read_frame(sql, conn, params=params)
+        for sql, params in _report_queries(start_date, end_date, stage, section, lab, subject)
+    ])
+
+
+def iter_attendance_report_between_dates(
+    start_date: datetime.date,
+    end_date: datetime.date,
+    stage: Optional[str] = None,
+    section: Optional[str] = None,
+    lab: Optional[str] = None,
+    subject: Optional[str] = None,
+    chunk_size: int = 2000,
+) -> Iterator[tuple]:
+    """Yield report rows (in REPORT_COLUMNS order) straight from the cursor, chunk by chunk."""
+    for sql, params in _report_queries(start_date, end_date, stage, section, lab, subject):
+        cur = get_conn().execute(sql, params)
+        try:
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for r in rows:
+                    yield tuple(r)
+        finally:
+            cur.close()
+
+
+# Keyset for paging through the report: unique per attendance row, NULLs folded to ''
+_REPORT_KEY = (
+    "a.day",
+    "s.stage",
+    "COALESCE(s.section, '')",
+    "COALESCE(s.lab, '')",
+    "s.name",
+    "s.exam_number",
+    "a.subject_id",
+)
+_REPORT_KEY_TYPES = (int, str, str, str, str, str, int)
+
+
+def is_report_key(after: Optional[Sequence[object]]) -> bool:
+    """Whether `after` has the shape of a key returned by get_attendance_report_page."""
+    return (
+        isinstance(after, (list, tuple))
+        and len(after) == len(_REPORT_KEY)
+        and all(type(v) is t for v, t in zip(after, _REPORT_KEY_TYPES))
+    )
+
+
+def get_attendance_report_page(
+    start_date: datetime.date,
+    end_date: datetime.date,
+    stage: Optional[str] = None,
+    section: Optional[str] = None,
+    lab: Optional[str] = None,
+    subject: Optional[str] = None,
+    after: Optional[Sequence[object]] = None,
+    page_size: int = 50,
+) -> Tuple[List[dict], Optional[list]]:
+    """
+    One page of the report ordered by (date, stage, section, lab, name).
+    `after` is the key returned for the previous page; returns (rows, next_key or None).
+    A key of the wrong shape (stale or edited) restarts from the first page.
+    """
+    if not is_report_key(after):
+        after = None
+    key = ", ".join(_REPORT_KEY)
+    rows: List[sqlite3.Row] = []
+    for schema, start_day, end_day in _partitions(start_date, end_date):
+        if after and end_day < after[0]:
+            continue
+        where, params = _report_where(start_day, end_day, stage, section, lab, subject)
+        if after:
+            # The plain day bound lets the index skip straight to the cursor's day
+            where += f" AND a.day >= ? AND ({key}) > ({', '.join('?' * len(_REPORT_KEY))})"
+            params.append(after[0])
+            params.extend(after)
+        sql = f"""
+            {_REPORT_SELECT}, {key}
+            {_REPORT_FROM.format(schema=schema)}
+            WHERE {where}
+            ORDER BY {key}
+            LIMIT ?
+        """
+        params.append(page_size + 1 - len(rows))
+        rows += get_conn().execute(sql, params).fetchall()
+        if len(rows) > page_size:
+            break
+    width = len(REPORT_COLUMNS)
+    page = [dict(zip(REPORT_COLUMNS, tuple(r)[:width])) for r in rows[:page_size]]
+    next_key = list(tuple(rows[page_size - 1])[width:]) if len(rows) > page_size else None
+    return page, next_key
+
+
+def count_attendance_report(
+    start_date: datetime.date,
+    end_date: datetime.date,
+    stage: Optional[str] = None,
+    section: Optional[str] = None,
+    lab: Optional[str] = None,
+    subject: Optional[str] = None,
+) -> int:
+    total = 0
+    for schema, start_day, end_day in _partitions(start_date, end_date):
+        where, params = _report_where(start_day, end_day, stage, section, lab, subject)
+        row = get_conn().execute(
+            f"SELECT COUNT(*) {_REPORT_FROM.format(schema=schema)} WHERE {where}",
+            params,
+        ).fetchone()
+        total += int(row[0])
+    return total
+
+
+def _attendance_source(start_date: datetime.date, end_date: datetime.date) -> Tuple[str, List[object]]:
+    """Attendance rows in the range from every partition, as one subquery to aggregate over."""
+    parts, params = [], []
+    for schema, start_day, end_day in _partitions(start_date, end_date):
+        parts.append(
+            f"SELECT student_id, day, subject_id, status FROM {schema}.attendance_compact WHERE day BETWEEN ? AND ?"
+        )
+        params += [start_day, end_day]
+    return f"({' UNION ALL '.join(parts)})", params
+
+
+def get_attendance_matrix(
+    start_date: datetime.date,
+    end_date: datetime.date,
+    stage: Optional[str] = None,
+    section: Optional[str] = None,
+    lab: Optional[str] = None,
+    subject: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    One row per student, one column per class day, then present/absent/absence_rate
+    over the range. A cell is 'ح' (present), 'غ' (absent) or present/total when the
+    student had several subjects that day; empty when nothing was recorded.
+    """
+    import pandas as pd
+
+    source, params = _attendance_source(start_date, end_date)
+    where, where_params = _report_where(_day(start_date), _day(end_date), stage, section, lab, subject)
+    conn = get_conn()
+    # Only ids, day numbers and marks cross into Python; names come with the totals below
+    days = _read_frame(
+        f"""
+        SELECT a.student_id, a.day,
+               CASE SUM(a.status) WHEN COUNT(*) THEN 'ح' WHEN 0 THEN 'غ'
+                    ELSE SUM(a.status) || '/' || COUNT(*) END AS mark
+        FROM {source} a JOIN students s ON s.id = a.student_id
+        WHERE {where}
+        GROUP BY a.student_id, a.day
+        """,
+        conn,
+        params=params + where_params,
+    )
+    columns = ["name", "exam_number", "section"]
+    if days.empty:
+        return pd.DataFrame(columns=columns + ["present", "absent", "absence_rate"])
+    wide = days.pivot(index="student_id", columns="day", values="mark").fillna("")
+    wide.columns = pd.to_datetime(wide.columns, unit="D").strftime("%Y-%m-%d")
+    # Names, range totals and row order come from SQL, as in get_absence_rates
+    students = _read_frame(
+        f"""
+        SELECT a.student_id, s.name, s.exam_number, COALESCE(s.section, '') AS section,
+               SUM(a.status) AS present, SUM(a.status = 0) AS absent,
+               ROUND(100.0 * SUM(a.status = 0) / COUNT(*), 1) AS absence_rate
+        FROM {source} a JOIN students s ON s.id = a.student_id
+        WHERE {where}
+        GROUP BY a.student_id
+        ORDER BY section, s.name, a.student_id
+        """,
+        conn,
+        params=params + where_params,
+        index_col="student_id",
+    )
+    # fillna: a student whose first row in the range landed between the two reads
+    out = students[columns].join(wide).fillna("").join(students[["present", "absent", "absence_rate"]])
+    return out.reset_index(drop=True)
+
+
+def get_absence_rates(
+    start_date: datetime.date,
+    end_date: datetime.date,
+    stage: Optional[str] = None,
+    section: Optional[str] = None,
+    lab: Optional[str] = None,
+    subject: Optional[str] = None,
+    by: str = "student",
+) -> pd.DataFrame:
+    """Present/absent counts and absence rate (%) per student or per section, highest rate first."""
+    if by == "student":
+        columns = "s.name, s.exam_number, s.stage, COALESCE(s.section, '') AS section, COALESCE(s.lab, '') AS lab"
+        group = "a.student_id"
+    elif by == "section":
+        columns = "s.stage, COALESCE(s.section, '') AS section, COUNT(DISTINCT a.student_id) AS students"
+        group = "s.stage, COALESCE(s.section, '')"
+    else:
+        raise ValueError(f"unknown grouping: {by}")
+    source, params = _attendance_source(start_date, end_date)
+    where, where_params = _report_where(_day(start_date), _day(end_date), stage, section, lab, subject)
+    return _read_frame(
+        f"""
+        SELECT {columns},
+               SUM(a.status) AS present, SUM(a.status = 0) AS absent, COUNT(*) AS total,
+               ROUND(100.0 * SUM(a.status = 0) / COUNT(*), 1) AS absence_rate
+        FROM {source} a JOIN students s ON s.id = a.student_id
+        WHERE {where}
+        GROUP BY {group}
+        ORDER BY absence_rate DESC, 1, 2
+        """,
+        get_conn(),
+        params=params + where_params,
+    )
+
+
+def get_report_stamp(start_date: datetime.date, end_date: datetime.date, stage: Optional[str] = None) -> str:
+    """
+    Version stamp for report data in a date range (and stage). It changes whenever
+    attendance on one of those dates, or a student in that stage, is written.
     """
     with get_conn() as conn:
-        return pd.read_sql_query(sql, conn, params=params)
+        days = conn.execute(
+            "SELECT COALESCE(SUM(version), 0), COUNT(*) FROM attendance_day_versions WHERE date BETWEEN ? AND ?",
+            (start_date.isoformat(), end_date.isoformat()),
+        ).fetchone()
+        if stage:
+            roster = conn.execute("SELECT COALESCE(SUM(version), 0) FROM roster_versions WHERE stage = ?", (stage,)).fetchone()
+        else:
+            roster = conn.execute("SELECT COALESCE(SUM(version), 0) FROM roster_versions").fetchone()
+    return f"{days[0]}.{days[1]}.{roster[0]}"
 
 
-def get_distinct_stages(defaults: Optional[Iterable[str]] = None) -> List[str]:
+# In-process cache of dropdown lookups. Entries are tagged with the 'lookups' generation
+# counter, which triggers bump on any student insert/delete/regroup in any worker.
+_lookup_cache: dict = {}
+_lookup_lock = threading.Lock()
+
+
+def _lookup_generation() -> int:
     with get_conn() as conn:
-        rows = conn.execute("SELECT DISTINCT stage FROM students ORDER BY stage").fetchall()
-        stages = [r[0] for r in rows]
+        row = conn.execute("SELECT value FROM summary_counters WHERE name = 'lookups'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def _cached_lookup(key: tuple, load) -> List[str]:
+    generation = _lookup_generation()
+    hit = _lookup_cache.get(key)
+    if hit is not None and hit[0] == generation:
+        return list(hit[1])
+    values = load()
+    with _lookup_lock:
+        _lookup_cache[key] = (generation, values)
+    return list(values)
+
+
+def invalidate_lookups() -> None:
+    with _lookup_lock:
+        _lookup_cache.clear()
+
+
+def get_distinct_stages(defaults: Optional[Iterable[str]] = None) -> List[str]:
+    def load() -> List[str]:
+        with get_conn() as conn:
+            rows = conn.execute("SELECT DISTINCT stage FROM students ORDER BY stage").fetchall()
+        return [r[0] for r in rows]
+
+    stages = _cached_lookup(("stages",), load)
     if defaults:
         for s in defaults:
             if s not in stages:
@@ -243,13 +1564,31 @@ def get_distinct_stages(defaults: Optional[Iterable[str]] = None) -> List[str]:
 
 
 def get_sections_for_stage(stage: str) -> List[str]:
-    with get_conn() as conn:
-        rows = conn.execute(
-            "SELECT DISTINCT COALESCE(NULLIF(section,''),'') FROM students WHERE stage=? ORDER BY section",
-            (stage,),
-        ).fetchall()
+    def load() -> List[str]:
+        with get_conn() as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT section FROM students WHERE stage=? ORDER BY section",
+                (stage,),
+            ).fetchall()
         sections = [r[0] or "" for r in rows]
-    return sorted([s for s in sections if s])
+        return sorted([s for s in sections if s])
+
+    return _cached_lookup(("sections", stage), load)
+
+
+def get_distinct_labs(defaults: Optional[Iterable[str]] = None) -> List[str]:
+    def load() -> List[str]:
+        with get_conn() as conn:
+            rows = conn.execute("SELECT DISTINCT lab FROM students WHERE lab <> '' ORDER BY lab").fetchall()
+        return [r[0] for r in rows]
+
+    labs = _cached_lookup(("labs",), load)
+    if defaults:
+        for lab in defaults:
+            if lab not in labs:
+                labs.append(lab)
+        labs.sort()
+    return labs
 
 
 def update_student(student_id: int, name: str, exam_number: str, stage: str, section: str, lab: str) -> Tuple[bool, str]:
@@ -263,14 +1602,26 @@ def update_student(student_id: int, name: str, exam_number: str, stage: str, sec
                 """,
                 (name, exam_number, stage, section, lab, student_id),
             )
+        invalidate_lookups()
         return True, ""
     except sqlite3.IntegrityError:
         return False, "الرقم الامتحاني مستخدم لطالب آخر."
 
 
 def delete_student(student_id: int) -> None:
-    with get_conn() as conn:
+    """
+    Delete a student with their attendance, including rows already moved to archives;
+    those are taken out of the dashboard summary the rollover kept for them.
+    """
+    conn = get_conn()
+    # ATTACH is refused inside a transaction, so the archives are attached first
+    schemas = _attach_archives(conn, archived_years())
+    with conn:
+        for schema in schemas:
+            _uncount_archived(conn, schema, "a.student_id = ?", (student_id,))
+            conn.execute(f"DELETE FROM {schema}.attendance_compact WHERE student_id = ?", (student_id,))
         conn.execute("DELETE FROM students WHERE id=?", (student_id,))
+    invalidate_lookups()
 
 
 def get_students_filtered(
@@ -282,49 +1633,180 @@ def get_students_filtered(
 ) -> List[dict]:
     where: List[str] = []
     params: List[object] = []
-    if name_contains:
-        where.append("name LIKE ?"); params.append(f"%{name_contains}%")
     if exam_number:
-        where.append("exam_number = ?"); params.append(exam_number)
+        where.append("s.exam_number = ?"); params.append(exam_number)
     if stage:
-        where.append("stage = ?"); params.append(stage)
+        where.append("s.stage = ?"); params.append(stage)
     if section:
-        where.append("section = ?"); params.append(section)
+        where.append("s.section = ?"); params.append(section)
     if lab:
-        where.append("lab = ?"); params.append(lab)
-    sql = "SELECT id, name, exam_number, stage, section, lab, created_at FROM students"
-    if where:
-        sql += " WHERE " + " AND ".join(where)
-    sql += " ORDER BY name"
+        where.append("s.lab = ?"); params.append(lab)
+    sql, params = _students_query(
+        "s.id, s.name, s.exam_number, s.stage, s.section, s.lab, s.created_at",
+        name_contains,
+        where,
+        params,
+    )
     with get_conn() as conn:
         rows = conn.execute(sql, params).fetchall()
         return [dict(r) for r in rows]
 
 
-def bulk_import_students(students_list: List[dict]) -> Tuple[int, int]:
+def _import_records(students_list: List[dict]) -> List[Tuple[int, tuple]]:
+    """(row, (name, exam_number, stage, section, lab)) pairs from rows already cleaned by normalize_student_frame."""
+    return [
+        (s["row"], (s["name"], s["exam_number"], s["stage"], s.get("section", ""), s.get("lab", "")))
+        for s in students_list
+    ]
+
+
+def bulk_import_students(students_list: List[dict]) -> Tuple[int, List[dict]]:
     """
-    Bulk import students. Returns (success_count, error_count)
-    Each dict should have: name, exam_number, stage, section (optional), lab (optional)
+    Bulk import students. Returns (added_count, errors)
+    Rows must come from utils_import.normalize_student_frame, which already stripped them,
+    checked required fields and dropped in-file duplicates; each has name, exam_number, stage,
+    section, lab and "row" (its spreadsheet row). Only clashes with the roster are reported
+    here, each as {"row", "exam_number", "error"}.
     """
-    added = 0
-    errors = 0
+    created_at = datetime.datetime.now().isoformat(timespec="seconds")
+    records = _import_records(students_list)
+    errors: List[dict] = []
     with get_conn() as conn:
-        for s in students_list:
-            try:
-                name = s.get("name", "").strip()
-                exam_number = s.get("exam_number", "").strip()
-                stage = s.get("stage", "").strip()
-                section = s.get("section", "").strip()
-                lab = s.get("lab", "").strip()
-                if name and exam_number and stage:
-                    conn.execute(
-                        "INSERT INTO students(name, exam_number, stage, section, lab, created_at) VALUES (?,?,?,?,?,?)",
-                        (name, exam_number, stage, section, lab, datetime.datetime.now().isoformat(timespec="seconds")),
-                    )
-                    added += 1
-                else:
-                    errors += 1
-            except sqlite3.IntegrityError:
-                errors += 1
-        conn.commit()
-    return added, errors
+        # One set-based lookup for every exam number already on the roster
+        existing = {
+            r[0]
+            for r in conn.execute(
+                "SELECT exam_number FROM students WHERE exam_number IN (SELECT value FROM json_each(?))",
+                (json.dumps([rec[1] for _, rec in records]),),
+            )
+        }
+        params = []
+        for row, rec in records:
+            if rec[1] in existing:
+                errors.append({"row": row, "exam_number": rec[1], "error": "الرقم الامتحاني موجود مسبقاً."})
+                continue
+            params.append(rec + (created_at,))
+        conn.executemany(
+            "INSERT INTO students(name, exam_number, stage, section, lab, created_at) VALUES (?,?,?,?,?,?)",
+            params,
+        )
+    invalidate_lookups()
+    errors.sort(key=lambda e: e["row"])
+    return len(params), errors
+
+
+def sync_students(students_list: List[dict], report_removals: bool = False) -> dict:
+    """
+    Merge an uploaded roster into students by exam_number, keeping ids (and so attendance).
+    Only new students and students whose fields changed are written, in one transaction.
+    Returns {"added", "updated", "unchanged", "errors", "removed"}; "removed" lists exam
+    numbers on the roster but missing from the upload (only when report_removals is set).
+    Rows must come from utils_import.normalize_student_frame, as for bulk_import_students;
+    "errors" is kept for the same shape and is always empty. An optional column the upload
+    lacks (section, lab) keeps each existing student's current value.
+    """
+    created_at = datetime.datetime.now().isoformat(timespec="seconds")
+    records = _import_records(students_list)
+    # Positions in the record tuple of optional columns missing from the upload
+    absent = [i for i, col in ((3, "section"), (4, "lab")) if students_list and col not in students_list[0]]
+    with get_conn() as conn:
+        current = {
+            r["exam_number"]: (r["name"], r["exam_number"], r["stage"], r["section"] or "", r["lab"] or "")
+            for r in conn.execute(
+                """
+                SELECT name, exam_number, stage, section, lab FROM students
+                WHERE exam_number IN (SELECT value FROM json_each(?))
+                """,
+                (json.dumps([rec[1] for _, rec in records]),),
+            )
+        }
+        params = []
+        added = updated = 0
+        for _, rec in records:
+            old = current.get(rec[1])
+            if old is not None and absent:
+                rec = tuple(old[i] if i in absent else value for i, value in enumerate(rec))
+            if old == rec:
+                continue
+            if old is None:
+                added += 1
+            else:
+                updated += 1
+            params.append(rec + (created_at,))
+        conn.executemany(
+            """
+            INSERT INTO students(name, exam_number, stage, section, lab, created_at) VALUES (?,?,?,?,?,?)
+            ON CONFLICT(exam_number) DO UPDATE
+            SET name=excluded.name, stage=excluded.stage, section=excluded.section, lab=excluded.lab
+            """,
+            params,
+        )
+        removed: List[str] = []
+        if report_removals:
+            removed = [
+                r[0]
+                for r in conn.execute(
+                    """
+                    SELECT exam_number FROM students
+                    WHERE exam_number NOT IN (SELECT value FROM json_each(?))
+                    ORDER BY exam_number
+                    """,
+                    (json.dumps([rec[1] for _, rec in records]),),
+                )
+            ]
+    invalidate_lookups()
+    return {
+        "added": added,
+        "updated": updated,
+        "unchanged": len(records) - added - updated,
+        "errors": [],
+        "removed": removed,
+    }
+
+
+EXPORT_JOB_COLUMNS = "id, key, format, params, status, rows_done, rows_total, path, error, pid, created_at, updated_at"
+
+
+def create_export_job(job_id: str, key: str, fmt: str, params: dict) -> None:
+    now = datetime.datetime.now().isoformat(timespec="seconds")
+    with get_conn() as conn:
+        conn.execute(
+            "INSERT INTO export_jobs(id, key, format, params, status, pid, created_at, updated_at) VALUES (?,?,?,?,?,?,?,?)",
+            (job_id, key, fmt, json.dumps(params, ensure_ascii=False), "pending", os.getpid(), now, now),
+        )
+
+
+def get_export_job(job_id: str) -> Optional[dict]:
+    with get_conn() as conn:
+        row = conn.execute(f"SELECT {EXPORT_JOB_COLUMNS} FROM export_jobs WHERE id = ?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def find_active_export_job(key: str) -> Optional[dict]:
+    """Most recent pending or running job for the same export request, if any."""
+    with get_conn() as conn:
+        row = conn.execute(
+            f"""
+            SELECT {EXPORT_JOB_COLUMNS} FROM export_jobs
+            WHERE key = ? AND status IN ('pending', 'running')
+            ORDER BY created_at DESC LIMIT 1
+            """,
+            (key,),
+        ).fetchone()
+    return dict(row) if row else None
+
+
+def update_export_job(job_id: str, **fields: object) -> None:
+    fields["updated_at"] = datetime.datetime.now().isoformat(timespec="seconds")
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with get_conn() as conn:
+        conn.execute(f"UPDATE export_jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+
+def delete_finished_export_jobs(older_than: datetime.datetime) -> int:
+    """Delete done/failed export jobs last updated before `older_than`; returns how many went."""
+    with get_conn() as conn:
+        return conn.execute(
+            "DELETE FROM export_jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+            (older_than.isoformat(timespec="seconds"),),
+        ).rowcount
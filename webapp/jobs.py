@@ -0,0 +1,151 @@
+import datetime
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, Optional
+
+from . import db, report_cache, reports
+from .utils_export import rows_to_excel_file, rows_to_pdf_bytes
+
+
+EXPORT_JOB_WORKERS = int(os.environ.get("EXPORT_JOB_WORKERS", "2"))
+# Finished jobs are kept as long as report files are, so a job never outlives its file by much
+EXPORT_JOB_MAX_AGE = int(os.environ.get("EXPORT_JOB_MAX_AGE", str(report_cache.REPORT_CACHE_MAX_AGE)))
+PROGRESS_EVERY = 1000
+
+FORMATS = {
+    "excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "pdf": ("pdf", "application/pdf"),
+}
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # Threads do not survive fork, so each gunicorn worker starts its own pool
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ThreadPoolExecutor(max_workers=EXPORT_JOB_WORKERS, thread_name_prefix="export-job")
+        _executor_pid = os.getpid()
+    return _executor
+
+
+def _filters_to_params(filters: tuple) -> dict:
+    start_date, end_date, stage, section, lab, subject = filters
+    return {
+        "start": start_date.isoformat(),
+        "end": end_date.isoformat(),
+        "stage": stage,
+        "section": section,
+        "lab": lab,
+        "subject": subject,
+    }
+
+
+def _params_to_filters(params: dict) -> tuple:
+    return (
+        datetime.date.fromisoformat(params["start"]),
+        datetime.date.fromisoformat(params["end"]),
+        params["stage"],
+        params["section"],
+        params["lab"],
+        params["subject"],
+    )
+
+
+def submit_export(fmt: str, filters: tuple, report: str = "records") -> str:
+    """
+    Queue an export and return its job id. Jobs are keyed by the report cache key, so
+    an identical export that is still pending or running is reused, and one already
+    in the cache completes immediately.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown export format: {fmt}")
+    if report not in reports.REPORT_TYPES:
+        raise ValueError(f"unknown report: {report}")
+    params = _filters_to_params(filters)
+    params["report"] = report
+    key = report_cache.cache_key(fmt, filters, report)
+    active = find_live_job(key)
+    if active:
+        return active["id"]
+    expire_jobs()
+    job_id = uuid.uuid4().hex
+    db.create_export_job(job_id, key, fmt, params)
+    cached = report_cache.lookup(key, FORMATS[fmt][0])
+    if cached:
+        db.update_export_job(job_id, status="done", path=str(cached))
+    else:
+        _get_executor().submit(_run_export, job_id, key, fmt, params)
+    return job_id
+
+
+def expire_jobs() -> int:
+    """Drop finished jobs older than EXPORT_JOB_MAX_AGE, like report_cache.evict does for files."""
+    return db.delete_finished_export_jobs(datetime.datetime.now() - datetime.timedelta(seconds=EXPORT_JOB_MAX_AGE))
+
+
+def find_live_job(key: str) -> Optional[dict]:
+    job = db.find_active_export_job(key)
+    if job and not _owner_alive(job):
+        db.update_export_job(job["id"], status="failed", error="worker exited")
+        return None
+    return job
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    job = db.get_export_job(job_id)
+    if job and job["status"] in ("pending", "running") and not _owner_alive(job):
+        db.update_export_job(job_id, status="failed", error="worker exited")
+        job = db.get_export_job(job_id)
+    return job
+
+
+def _owner_alive(job: dict) -> bool:
+    pid = job.get("pid")
+    if not pid or pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _track_progress(job_id: str, rows: Iterable[tuple]) -> Iterator[tuple]:
+    done = 0
+    for row in rows:
+        yield row
+        done += 1
+        if done % PROGRESS_EVERY == 0:
+            db.update_export_job(job_id, rows_done=done)
+    db.update_export_job(job_id, rows_done=done)
+
+
+def _run_export(job_id: str, key: str, fmt: str, params: dict) -> None:
+    try:
+        filters = _params_to_filters(params)
+        report = params.get("report", "records")
+        db.update_export_job(job_id, status="running")
+        columns, rows = reports.report_table(report, filters)
+        total = db.count_attendance_report(*filters) if report == "records" else len(rows)
+        db.update_export_job(job_id, rows_total=total)
+        rows = _track_progress(job_id, rows)
+        if fmt == "excel":
+            data = rows_to_excel_file(columns, rows)
+        else:
+            data = rows_to_pdf_bytes(
+                columns,
+                rows,
+                title=reports.report_title(report, filters),
+                repeat_columns=reports.PDF_REPEAT_COLUMNS.get(report, 0),
+            )
+        path = report_cache.store(key, FORMATS[fmt][0], data)
+        db.update_export_job(job_id, status="done", path=str(path))
+    except Exception as e:  # reported to the client through the status endpoint
+        db.update_export_job(job_id, status="failed", error=str(e))
+    finally:
+        db.release_conn()
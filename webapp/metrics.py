@@ -0,0 +1,324 @@
+import functools
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter as _Tally
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from flask import Flask, Response, request
+
+
+logger = logging.getLogger(__name__)
+
+# METRICS_ENABLED=0 connects with plain sqlite3 connections and skips the request hooks
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "250"))
+# Debug mode: log statements repeated N_PLUS_ONE_MIN+ times within one request
+QUERY_DEBUG = os.environ.get("QUERY_DEBUG", "0") == "1"
+N_PLUS_ONE_MIN = int(os.environ.get("N_PLUS_ONE_MIN", "10"))
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+_lock = threading.Lock()
+_state = threading.local()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    # Every series carries the worker's pid: each gunicorn worker keeps its own counts, and
+    # without the label two workers answering alternate scrapes would look like resets
+    pairs = [f'worker="{os.getpid()}"'] + [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        with _lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with _lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value:g}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket..., +Inf count, sum]
+        self._values: Dict[tuple, List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        with _lock:
+            slots = self._values.get(labels)
+            if slots is None:
+                slots = self._values[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    slots[i] += 1
+                    break
+            else:
+                slots[len(self.buckets)] += 1
+            slots[-1] += value
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with _lock:
+            items = sorted((labels, list(slots)) for labels, slots in self._values.items())
+        for labels, slots in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), slots):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                bucket = _labels(self.labelnames, labels, f'le="{le}"')
+                yield f"{self.name}_bucket{bucket} {cumulative:g}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {slots[-1]:g}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative:g}"
+
+
+SQL_SECONDS = Histogram(
+    "attendance_sql_query_seconds", "SQL statement time, execute plus fetch, by calling function", ("function",)
+)
+SQL_ROWS = Counter("attendance_sql_rows_total", "Rows fetched by SQL statements, by calling function", ("function",))
+SLOW_QUERIES = Counter("attendance_sql_slow_queries_total", "Statements slower than SLOW_QUERY_MS", ("function",))
+REQUEST_SECONDS = Histogram(
+    "attendance_http_request_seconds", "Request handling time", ("endpoint", "method", "status")
+)
+REQUEST_QUERIES = Histogram(
+    "attendance_http_request_queries", "SQL statements per request", ("endpoint",), COUNT_BUCKETS
+)
+REQUEST_SQL_SECONDS = Histogram("attendance_http_request_sql_seconds", "SQL time per request", ("endpoint",))
+LIBRARY_SECONDS = Histogram(
+    "attendance_library_seconds", "Time in pandas/xlsxwriter/openpyxl/reportlab, excluding the SQL they read through",
+    ("library",),
+)
+N_PLUS_ONE = Counter(
+    "attendance_n_plus_one_total", "Requests that repeated one statement N_PLUS_ONE_MIN+ times (QUERY_DEBUG=1)",
+    ("endpoint", "function"),
+)
+GROUP_COMMIT_BATCH = Histogram(
+    "attendance_group_commit_batch_size", "Attendance writes merged into one commit by the group-commit writer",
+    (), COUNT_BUCKETS,
+)
+GROUP_COMMIT_WAIT = Histogram(
+    "attendance_group_commit_wait_seconds", "Time an attendance write waited in the group-commit queue"
+)
+REGISTRY = (
+    SQL_SECONDS, SQL_ROWS, SLOW_QUERIES, REQUEST_SECONDS, REQUEST_QUERIES, REQUEST_SQL_SECONDS, LIBRARY_SECONDS, N_PLUS_ONE,
+    GROUP_COMMIT_BATCH, GROUP_COMMIT_WAIT,
+)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+# Helpers that run SQL on behalf of their caller; statements are attributed one frame up
+PASS_THROUGH = {"db._read_frame", "db._cached_lookup", "db.load"}
+
+
+def _caller() -> str:
+    # The innermost webapp function outside this module: usually the db.py query function
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith("webapp.") and module != __name__ and not frame.f_code.co_name.startswith("<"):
+            function = f"{module[len('webapp.'):]}.{frame.f_code.co_name}"
+            if function not in PASS_THROUGH:
+                return function
+        frame = frame.f_back
+    return "other"
+
+
+def record_query(function: str, sql: str, seconds: float, rows: int) -> None:
+    SQL_SECONDS.observe(seconds, function)
+    if rows:
+        SQL_ROWS.inc(rows, function)
+    _state.sql_seconds = getattr(_state, "sql_seconds", 0.0) + seconds
+    req = getattr(_state, "request", None)
+    if req is not None:
+        req["queries"] += 1
+        req["sql_seconds"] += seconds
+        if QUERY_DEBUG:
+            req["statements"][(function, sql)] += 1
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        SLOW_QUERIES.inc(1, function)
+        logger.warning("slow query: %.1f ms, %d rows, %s: %s", seconds * 1000, rows, function, " ".join(sql.split())[:500])
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Times each statement from execute() until its rows are exhausted (or the cursor is
+    reused or closed) and counts the rows fetched, then hands that to record_query.
+    """
+
+    _sql: Optional[str] = None
+
+    def _begin(self, sql: str, elapsed: float) -> None:
+        self._sql, self._elapsed, self._rows, self._function = sql, elapsed, 0, _caller()
+        if self.description is None:  # no result rows: writes, DDL, PRAGMA assignments
+            self._finish()
+
+    def _finish(self) -> None:
+        if self._sql is not None:
+            sql, self._sql = self._sql, None
+            record_query(self._function, sql, self._elapsed, self._rows)
+
+    def execute(self, sql: str, parameters=()) -> "InstrumentedCursor":
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._begin(sql, time.perf_counter() - start)
+
+    def executemany(self, sql: str, seq_of_parameters) -> "InstrumentedCursor":
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._begin(sql, time.perf_counter() - start)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        if self._sql is not None:
+            self._elapsed += time.perf_counter() - start
+            self._rows += row is not None
+            self._finish()
+        return row
+
+    def fetchmany(self, size: Optional[int] = None) -> list:
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        if self._sql is not None:
+            self._elapsed += time.perf_counter() - start
+            self._rows += len(rows)
+            if len(rows) < size:
+                self._finish()
+        return rows
+
+    def fetchall(self) -> list:
+        start = time.perf_counter()
+        rows = super().fetchall()
+        if self._sql is not None:
+            self._elapsed += time.perf_counter() - start
+            self._rows += len(rows)
+            self._finish()
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            if self._sql is not None:
+                self._elapsed += time.perf_counter() - start
+                self._finish()
+            raise
+        if self._sql is not None:
+            self._elapsed += time.perf_counter() - start
+            self._rows += 1
+        return row
+
+    def close(self) -> None:
+        self._finish()
+        super().close()
+
+    def __del__(self) -> None:
+        try:
+            self._finish()
+        except Exception:  # interpreter shutdown
+            pass
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection whose cursors, including the execute() shortcuts, are InstrumentedCursor."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql: str, parameters=()) -> InstrumentedCursor:
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters) -> InstrumentedCursor:
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+@contextmanager
+def library(name: str) -> Iterator[None]:
+    """Time a block spent in an export/dataframe library, minus the SQL run inside it."""
+    sql_before = getattr(_state, "sql_seconds", 0.0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start - (getattr(_state, "sql_seconds", 0.0) - sql_before)
+        LIBRARY_SECONDS.observe(max(elapsed, 0.0), name)
+
+
+def timed_library(name: str):
+    """Decorator form of library()."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with library(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _before_request() -> None:
+    _state.request = {
+        "start": time.perf_counter(),
+        "queries": 0,
+        "sql_seconds": 0.0,
+        "statements": _Tally(),
+    }
+
+
+def _after_request(response: Response) -> Response:
+    req = getattr(_state, "request", None)
+    if req is None:
+        return response
+    endpoint = request.endpoint or "unknown"
+    REQUEST_SECONDS.observe(time.perf_counter() - req["start"], endpoint, request.method, str(response.status_code))
+    REQUEST_QUERIES.observe(req["queries"], endpoint)
+    REQUEST_SQL_SECONDS.observe(req["sql_seconds"], endpoint)
+    for (function, sql), count in req["statements"].items():
+        if count >= N_PLUS_ONE_MIN:
+            N_PLUS_ONE.inc(1, endpoint, function)
+            logger.warning(
+                "possible N+1 in %s: %s ran the same statement %d times: %s",
+                endpoint, function, count, " ".join(sql.split())[:300],
+            )
+    _state.request = None
+    return response
+
+
+def init_app(app: Flask) -> None:
+    if METRICS_ENABLED:
+        app.before_request(_before_request)
+        app.after_request(_after_request)
@@ -0,0 +1,157 @@
+import cProfile
+import itertools
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional
+from urllib.parse import parse_qs
+
+from flask import Flask
+
+
+# Off unless PROFILING=1 (or app.config["PROFILING"]); then a request is profiled when it
+# carries the X-Profile header or ?_profile=1, or falls in the PROFILE_SAMPLE_RATE sample.
+PROFILING_ENABLED = os.environ.get("PROFILING", "0") == "1"
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR", Path(__file__).resolve().parent.parent / "profiles"))
+PROFILE_MODE = os.environ.get("PROFILE_MODE", "sample")  # "sample" -> .collapsed stacks, "cprofile" -> .prof
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "50"))
+
+# Tells apart profiles of the same path that finish within the same second in one process
+_sequence = itertools.count(1)
+
+
+class _StackSampler:
+    """
+    Samples one thread's Python stack every `interval` seconds from a helper thread and
+    tallies them as collapsed stacks ("outer;inner;leaf count"), the input format of
+    flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, thread_id: int, interval: float) -> None:
+        self.thread_id, self.interval = thread_id, interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names: List[str] = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path: Path) -> None:
+        path.write_text("".join(f"{stack} {count}\n" for stack, count in self.stacks.items()), encoding="utf-8")
+
+
+def _wanted(environ: dict) -> bool:
+    if environ.get("HTTP_X_PROFILE") == "1":
+        return True
+    if "1" in parse_qs(environ.get("QUERY_STRING", "")).get("_profile", []):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _profile_name(environ: dict, elapsed: float, extension: str) -> str:
+    path = re.sub(r"[^A-Za-z0-9]+", "_", environ.get("PATH_INFO", "")).strip("_") or "root"
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    return f"{stamp}-{environ.get('REQUEST_METHOD', 'GET')}-{path}-{elapsed * 1000:.0f}ms-{os.getpid()}-{next(_sequence)}.{extension}"
+
+
+def _prune(keep: int) -> None:
+    """Keep only the newest `keep` profiles."""
+    entries = []
+    for entry in os.scandir(PROFILE_DIR):
+        if entry.is_file() and entry.name.endswith((".prof", ".collapsed")):
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                continue
+    for _, path in sorted(entries)[:-keep or None]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class ProfilingMiddleware:
+    """
+    WSGI middleware that runs selected requests under cProfile or the stack sampler and
+    saves one file per request to PROFILE_DIR, named after the path and its duration.
+    The response body is drawn inside the profile too, so streamed exports are covered;
+    a profiled response is buffered and carries its file name in X-Profile-File.
+    """
+
+    def __init__(self, wsgi_app: Callable, mode: str = PROFILE_MODE) -> None:
+        if mode not in ("sample", "cprofile"):
+            raise ValueError(f"unknown profile mode: {mode}")
+        self.wsgi_app, self.mode = wsgi_app, mode
+
+    def __call__(self, environ: dict, start_response: Callable) -> Iterable[bytes]:
+        if not _wanted(environ):
+            return self.wsgi_app(environ, start_response)
+
+        captured: dict = {}
+        written: List[bytes] = []
+
+        def capture(status: str, headers: list, exc_info=None) -> Callable:
+            captured.update(status=status, headers=headers, exc_info=exc_info)
+            return written.append
+
+        start = time.perf_counter()
+        if self.mode == "cprofile":
+            profiler: Optional[cProfile.Profile] = cProfile.Profile()
+            sampler = None
+            profiler.enable()
+        else:
+            profiler = None
+            sampler = _StackSampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000)
+            sampler.start()
+        try:
+            result = self.wsgi_app(environ, capture)
+            try:
+                body = written + [chunk for chunk in result]
+            finally:
+                if hasattr(result, "close"):
+                    result.close()
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            else:
+                sampler.stop()
+        elapsed = time.perf_counter() - start
+
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        name = _profile_name(environ, elapsed, "prof" if profiler is not None else "collapsed")
+        if profiler is not None:
+            profiler.dump_stats(str(PROFILE_DIR / name))
+        else:
+            sampler.dump(PROFILE_DIR / name)
+        _prune(PROFILE_KEEP)
+
+        start_response(captured["status"], captured["headers"] + [("X-Profile-File", name)], captured["exc_info"])
+        return body
+
+
+def init_app(app: Flask) -> None:
+    # Nothing is wrapped when disabled, so production pays no per-request cost
+    if app.config.get("PROFILING", PROFILING_ENABLED):
+        app.wsgi_app = ProfilingMiddleware(app.wsgi_app)  # type: ignore[method-assign]
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import IO, Optional, Union
+
+from . import db
+
+
+# Generated reports keyed by (format, report type, filters, data version stamp)
+REPORT_CACHE_DIR = Path(os.environ.get("REPORT_CACHE_DIR", Path(__file__).resolve().parent.parent / "report_cache"))
+REPORT_CACHE_MAX_BYTES = int(os.environ.get("REPORT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+REPORT_CACHE_MAX_AGE = int(os.environ.get("REPORT_CACHE_MAX_AGE", str(7 * 24 * 3600)))
+
+
+def cache_key(fmt: str, filters: tuple, report: str = "records") -> str:
+    """Content address for a report: changes when the filters or the underlying data change."""
+    start_date, end_date, stage, section, lab, subject = filters
+    payload = {
+        "format": fmt,
+        "report": report,
+        "start": start_date.isoformat(),
+        "end": end_date.isoformat(),
+        "stage": stage,
+        "section": section,
+        "lab": lab,
+        "subject": subject,
+        "stamp": db.get_report_stamp(start_date, end_date, stage),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _path(key: str, extension: str) -> Path:
+    return REPORT_CACHE_DIR / f"{key}.{extension}"
+
+
+def lookup(key: str, extension: str) -> Optional[Path]:
+    path = _path(key, extension)
+    try:
+        os.utime(path)  # recency for eviction
+    except OSError:
+        return None
+    return path
+
+
+def store(key: str, extension: str, data: Union[bytes, IO[bytes]]) -> Path:
+    """Write a report atomically into the cache and evict old entries; returns its path."""
+    REPORT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = _path(key, extension)
+    tmp = REPORT_CACHE_DIR / f".{uuid.uuid4().hex}.part"
+    with open(tmp, "wb") as out:
+        if isinstance(data, bytes):
+            out.write(data)
+        else:
+            while True:
+                chunk = data.read(1024 * 1024)
+                if not chunk:
+                    break
+                out.write(chunk)
+    os.replace(tmp, path)
+    evict(keep=path)
+    return path
+
+
+def open_entry(key: str, extension: str) -> Optional[IO[bytes]]:
+    """Open a cached report; the handle stays valid even if another worker evicts the file."""
+    path = lookup(key, extension)
+    if path is None:
+        return None
+    try:
+        return open(path, "rb")
+    except FileNotFoundError:
+        return None
+
+
+def evict(keep: Optional[Path] = None) -> None:
+    """Drop entries older than REPORT_CACHE_MAX_AGE, then the least recently used over REPORT_CACHE_MAX_BYTES."""
+    now = time.time()
+    entries = []
+    total = 0
+    for entry in os.scandir(REPORT_CACHE_DIR):
+        if entry.name.startswith(".") or not entry.is_file():
+            continue
+        try:
+            st = entry.stat()
+        except FileNotFoundError:  # evicted by another worker meanwhile
+            continue
+        if keep and entry.path == str(keep):
+            total += st.st_size
+        elif now - st.st_mtime > REPORT_CACHE_MAX_AGE:
+            _remove(entry.path)
+        else:
+            entries.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+    for _, size, path in sorted(entries):
+        if total <= REPORT_CACHE_MAX_BYTES:
+            break
+        _remove(path)
+        total -= size
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,54 @@
+from typing import Iterable, List, Tuple
+
+from . import db
+
+
+# Report types offered on /export -> title used in the PDF header and on the page
+REPORT_TYPES = {
+    "records": "تقرير الحضور",
+    "matrix": "مصفوفة الحضور",
+    "student_rates": "نسب الغياب حسب الطالب",
+    "section_rates": "نسب الغياب حسب الشعبة",
+}
+
+# Column key -> Arabic table header for the aggregate reports (date columns keep their date)
+COLUMN_LABELS = {
+    "name": "الاسم",
+    "exam_number": "الرقم الامتحاني",
+    "stage": "المرحلة",
+    "section": "الشعبة",
+    "lab": "المختبر",
+    "students": "عدد الطلبة",
+    "present": "حضور",
+    "absent": "غياب",
+    "total": "المجموع",
+    "absence_rate": "نسبة الغياب %",
+}
+
+# Leading columns repeated on every band of pages when a PDF is too wide for one
+# (the matrix's name, exam number and section beside each run of dates)
+PDF_REPEAT_COLUMNS = {"matrix": 3}
+
+
+def report_table(report: str, filters: tuple) -> Tuple[List[str], Iterable[tuple]]:
+    """
+    Columns and rows of a report over the export filters, ready for the Excel/PDF/CSV
+    writers. Attendance records stream from the cursor; the aggregate reports are a
+    few thousand rows at most and come back as a list.
+    """
+    if report == "records":
+        return db.REPORT_COLUMNS, db.iter_attendance_report_between_dates(*filters)
+    if report == "matrix":
+        df = db.get_attendance_matrix(*filters)
+    elif report == "student_rates":
+        df = db.get_absence_rates(*filters, by="student")
+    elif report == "section_rates":
+        df = db.get_absence_rates(*filters, by="section")
+    else:
+        raise ValueError(f"unknown report: {report}")
+    # object dtype boxes numpy scalars into plain int/float, which json and openpyxl expect
+    return [str(c) for c in df.columns], list(df.astype(object).itertuples(index=False, name=None))
+
+
+def report_title(report: str, filters: tuple) -> str:
+    return f"{REPORT_TYPES[report]} ({filters[0]} - {filters[1]})"
@@ -1,15 +1,22 @@
+import base64
 import datetime
-from io import BytesIO
+import json
+import os
 from typing import Optional
 
-import pandas as pd
-from flask import Blueprint, Response, flash, redirect, render_template, request, send_file, url_for
+from flask import Blueprint, Response, flash, jsonify, redirect, render_template, request, send_file, stream_with_context, url_for
 
+from . import jobs, metrics, report_cache, reports, write_queue
 from .db import (
     add_student,
-    get_attendance_by_student,
-    get_attendance_for_date_stage_section,
-    get_attendance_report_between_dates,
+    autocomplete_students,
+    get_attendance_page_for_student,
+    get_attendance_statuses,
+    count_attendance_report,
+    get_attendance_report_page,
+    get_dashboard_counts,
+    is_report_key,
+    get_distinct_labs,
     get_distinct_stages,
     get_sections_for_stage,
     get_students,
@@ -18,23 +25,23 @@ from .db import (
     get_students_filtered,
     update_student,
     delete_student,
-    upsert_attendance_for_date,
     bulk_import_students,
+    sync_students,
 )
-from .utils_export import dataframe_to_excel_bytes, dataframe_to_pdf_bytes
+from .utils_export import gzip_chunks, iter_csv, iter_ndjson, rows_to_excel_file, rows_to_pdf_bytes
+from .utils_import import normalize_student_frame
 
 
 bp = Blueprint("main", __name__)
 
+DEFAULT_LABS = ["LAB1", "LAB2", "LAB3", "LAB4"]
+IMPORT_ERRORS_SHOWN = 20
+
 
 @bp.route("/")
 def index() -> str:
-    today = datetime.date.today()
-    students = get_students()
-    df_today = get_attendance_for_date_stage_section(today)
-    present = int((df_today.status == "present").sum()) if not df_today.empty else 0
-    absent = int((df_today.status == "absent").sum()) if not df_today.empty else 0
-    return render_template("index.html", total=len(students), present=present, absent=absent)
+    total, present, absent = get_dashboard_counts(datetime.date.today())
+    return render_template("index.html", total=total, present=present, absent=absent)
 
 
 @bp.route("/students", methods=["GET", "POST"])
@@ -55,7 +62,10 @@ def students_page() -> str:
             else:
                 flash(msg or "فشل الحفظ.", "danger")
     students = get_students()
-    return render_template("students.html", students=students)
+    return render_template("students.html", students=students, labs=get_distinct_labs(defaults=DEFAULT_LABS))
+
+
+SEARCH_RESULTS_LIMIT = 200
 
 
 @bp.route("/search", methods=["GET"]) 
@@ -63,12 +73,37 @@ def search_page() -> str:
     q_name = request.args.get("name", "").strip()
     q_exam = request.args.get("exam", "").strip()
     q_lab = request.args.get("lab", "").strip()
-    results = search_students(name_contains=q_name, exam_number=q_exam, lab=q_lab or None)
+    results = search_students(name_contains=q_name, exam_number=q_exam, lab=q_lab or None, limit=SEARCH_RESULTS_LIMIT)
     selected_exam = request.args.get("selected_exam", "")
-    att = []
-    if selected_exam:
-        att = get_attendance_by_student(selected_exam)
-    return render_template("search.html", results=results, att=att, selected_exam=selected_exam)
+    # The attendance history is fetched page by page from the JSON API
+    return render_template("search.html", results=results, selected_exam=selected_exam, labs=get_distinct_labs(defaults=DEFAULT_LABS))
+
+
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX = 50
+HISTORY_PAGE_SIZE = 50
+HISTORY_PAGE_MAX = 200
+
+
+@bp.get("/api/students")
+def api_students() -> Response:
+    q = request.args.get("q", "").strip()
+    limit = min(max(request.args.get("limit", AUTOCOMPLETE_LIMIT, type=int), 1), AUTOCOMPLETE_MAX)
+    if not q:
+        return jsonify({"results": [], "next": None})
+    rows, next_key = autocomplete_students(q, after=_decode_cursor(request.args.get("cursor")), limit=limit)
+    return jsonify({"results": rows, "next": _encode_cursor(next_key) if next_key else None})
+
+
+@bp.get("/api/students/<exam_number>/attendance")
+def api_student_attendance(exam_number: str) -> Response:
+    limit = min(max(request.args.get("limit", HISTORY_PAGE_SIZE, type=int), 1), HISTORY_PAGE_MAX)
+    rows, next_key = get_attendance_page_for_student(
+        exam_number, after=_decode_cursor(request.args.get("cursor")), page_size=limit
+    )
+    if rows is None:
+        return jsonify({"error": "not found"}), 404
+    return jsonify({"exam_number": exam_number, "records": rows, "next": _encode_cursor(next_key) if next_key else None})
 
 
 @bp.route("/attendance", methods=["GET", "POST"]) 
@@ -90,32 +125,32 @@ def attendance_page() -> str:
     # Convert DataFrame to list of dicts for proper template rendering
     students_list = students_df.to_dict('records') if not students_df.empty else []
     
-    att_df = get_attendance_for_date_stage_section(
-        date=selected_date,
-        stage=None if stage == "الكل" else stage,
-        section=None if section == "الكل" else section,
-        lab=None if lab == "الكل" else lab,
-        subject=None if subject == "الكل" else subject,
-    )
-    prefill = {}
-    if not att_df.empty:
-        for _, r in att_df.iterrows():
-            prefill[str(r["exam_number"])]= r["status"]
-
     if request.method == "POST":
         subject_val = request.form.get("subject", "")
-        saved = 0
+        entries = []
         for s in students_list:
             exam_no = str(s.get("exam_number", ""))
             val = request.form.get(f"status_{exam_no}")
             if val:
-                if upsert_attendance_for_date(exam_no, selected_date, val, subject_val):
-                    saved += 1
+                entries.append((exam_no, val))
+        saved, failures = write_queue.upsert_attendance_bulk(selected_date, entries, subject_val)
         flash(f"تم حفظ {saved} سجل/سجلات.", "success")
+        if failures:
+            flash("تعذر حفظ: " + "، ".join(f"{exam_no} ({reason})" for exam_no, reason in failures), "warning")
         return redirect(url_for("main.attendance_page", stage=stage, section=section, lab=lab, subject=subject, date=selected_date.isoformat()))
 
+    # Only the form needs the saved statuses; a POST redirects without reading them
+    prefill = get_attendance_statuses(
+        date=selected_date,
+        stage=None if stage == "الكل" else stage,
+        section=None if section == "الكل" else section,
+        lab=None if lab == "الكل" else lab,
+        subject=None if subject == "الكل" else subject,
+    )
+
     return render_template(
         "attendance.html",
+        labs=get_distinct_labs(defaults=DEFAULT_LABS),
         stages=stages,
         stage=stage,
         sections=sections,
@@ -128,6 +163,23 @@ def attendance_page() -> str:
     )
 
 
+PAGE_SIZES = (50, 100, 200, 500)
+
+
+def _encode_cursor(key: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key, ensure_ascii=False).encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(token: Optional[str]) -> Optional[list]:
+    if not token:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+    except (ValueError, UnicodeError):
+        return None
+    return key if isinstance(key, list) else None
+
+
 @bp.route("/export", methods=["GET"]) 
 def export_page() -> str:
     stages = ["الكل"] + get_distinct_stages(defaults=["الأولى", "الثانية", "الثالثة", "الرابعة"]) 
@@ -141,7 +193,7 @@ def export_page() -> str:
     start_date = datetime.date.fromisoformat(start) if start else datetime.date.today().replace(day=1)
     end_date = datetime.date.fromisoformat(end) if end else datetime.date.today()
 
-    df = get_attendance_report_between_dates(
+    filters = (
         start_date,
         end_date,
         None if stage == "الكل" else stage,
@@ -149,37 +201,175 @@ def export_page() -> str:
         None if lab == "الكل" else lab,
         None if subject == "الكل" else subject,
     )
-    return render_template("export.html", stages=stages, sections=sections, stage=stage, section=section, lab=lab, subject=subject, start_date=start_date, end_date=end_date, df=df)
+    per_page = min(max(request.args.get("per_page", PAGE_SIZES[0], type=int), 1), PAGE_SIZES[-1])
+    report = _export_report()
+    after = _decode_cursor(request.args.get("after"))
+    if not is_report_key(after):
+        after = None  # stale or edited cursor: show the first page
+    columns = None
+    next_key = None
+    if report == "records":
+        rows, next_key = get_attendance_report_page(*filters, after=after, page_size=per_page)
+        total = count_attendance_report(*filters)
+    else:
+        # Aggregates are small; preview the first rows, the downloads carry them all
+        columns, rows = reports.report_table(report, filters)
+        total = len(rows)
+        rows = rows[:per_page]
+    return render_template(
+        "export.html",
+        labs=get_distinct_labs(defaults=DEFAULT_LABS),
+        stages=stages,
+        sections=sections,
+        stage=stage,
+        section=section,
+        lab=lab,
+        subject=subject,
+        start_date=start_date,
+        end_date=end_date,
+        rows=rows,
+        total=total,
+        per_page=per_page,
+        page_sizes=PAGE_SIZES,
+        report=report,
+        report_types=reports.REPORT_TYPES,
+        columns=columns,
+        column_labels=reports.COLUMN_LABELS,
+        is_first_page=after is None,
+        next_cursor=_encode_cursor(next_key) if next_key else None,
+    )
 
 
-@bp.get("/export/excel")
-def export_excel() -> Response:
-    stage = request.args.get("stage")
-    section = request.args.get("section")
-    lab = request.args.get("lab")
-    subject = request.args.get("subject")
-    start = request.args.get("start")
-    end = request.args.get("end")
+def _export_filters() -> tuple:
+    """Read the report filters shared by the export download routes."""
+    stage = request.values.get("stage")
+    section = request.values.get("section")
+    lab = request.values.get("lab")
+    subject = request.values.get("subject")
+    start = request.values.get("start")
+    end = request.values.get("end")
     start_date = datetime.date.fromisoformat(start) if start else datetime.date.today().replace(day=1)
     end_date = datetime.date.fromisoformat(end) if end else datetime.date.today()
-    df = get_attendance_report_between_dates(start_date, end_date, None if stage in (None, "الكل") else stage, None if section in (None, "الكل") else section, None if lab in (None, "الكل") else lab, None if subject in (None, "الكل") else subject)
-    data = dataframe_to_excel_bytes(df)
-    return send_file(BytesIO(data), download_name=f"attendance_{start_date}_to_{end_date}.xlsx", as_attachment=True, mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    return (
+        start_date,
+        end_date,
+        None if stage in (None, "الكل") else stage,
+        None if section in (None, "الكل") else section,
+        None if lab in (None, "الكل") else lab,
+        None if subject in (None, "الكل") else subject,
+    )
+
+
+def _export_report() -> str:
+    """The requested report type; attendance records unless another known type is asked for."""
+    report = request.values.get("report", "records")
+    return report if report in reports.REPORT_TYPES else "records"
+
+
+def _download_name(report: str, start, end, extension: str) -> str:
+    prefix = "attendance" if report == "records" else f"attendance_{report}"
+    return f"{prefix}_{start}_to_{end}.{extension}"
+
+
+def _send_cached_report(fmt: str, build) -> Response:
+    """Serve a report from the disk cache, building and storing it first on a miss."""
+    filters = _export_filters()
+    report = _export_report()
+    start_date, end_date = filters[0], filters[1]
+    extension, mimetype = jobs.FORMATS[fmt]
+    key = report_cache.cache_key(fmt, filters, report)
+    data = report_cache.open_entry(key, extension)
+    if data is None:
+        report_cache.store(key, extension, build(report, filters))
+        data = report_cache.open_entry(key, extension)
+    return send_file(data, download_name=_download_name(report, start_date, end_date, extension), as_attachment=True, mimetype=mimetype, etag=key)
+
+
+@bp.get("/export/excel")
+def export_excel() -> Response:
+    return _send_cached_report(
+        "excel",
+        lambda report, filters: rows_to_excel_file(*reports.report_table(report, filters)),
+    )
 
 
 @bp.get("/export/pdf")
 def export_pdf() -> Response:
-    stage = request.args.get("stage")
-    section = request.args.get("section")
-    lab = request.args.get("lab")
-    subject = request.args.get("subject")
-    start = request.args.get("start")
-    end = request.args.get("end")
-    start_date = datetime.date.fromisoformat(start) if start else datetime.date.today().replace(day=1)
-    end_date = datetime.date.fromisoformat(end) if end else datetime.date.today()
-    df = get_attendance_report_between_dates(start_date, end_date, None if stage in (None, "الكل") else stage, None if section in (None, "الكل") else section, None if lab in (None, "الكل") else lab, None if subject in (None, "الكل") else subject)
-    data = dataframe_to_pdf_bytes(df, title=f"تقرير الحضور ({start_date} - {end_date})")
-    return send_file(BytesIO(data), download_name=f"attendance_{start_date}_to_{end_date}.pdf", as_attachment=True, mimetype="application/pdf")
+    return _send_cached_report(
+        "pdf",
+        lambda report, filters: rows_to_pdf_bytes(
+            *reports.report_table(report, filters),
+            title=reports.report_title(report, filters),
+            repeat_columns=reports.PDF_REPEAT_COLUMNS.get(report, 0),
+        ),
+    )
+
+
+@bp.post("/export/jobs")
+def export_job_create() -> Response:
+    fmt = request.values.get("format", "excel")
+    if fmt not in jobs.FORMATS:
+        return jsonify({"error": "unknown format"}), 400
+    job_id = jobs.submit_export(fmt, _export_filters(), _export_report())
+    return jsonify({"id": job_id, "status_url": url_for("main.export_job_status", job_id=job_id)}), 202
+
+
+@bp.get("/export/jobs/<job_id>")
+def export_job_status(job_id: str) -> Response:
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({"error": "not found"}), 404
+    payload = {
+        "id": job["id"],
+        "status": job["status"],
+        "rows_done": job["rows_done"],
+        "rows_total": job["rows_total"],
+        "error": job["error"],
+    }
+    if job["status"] == "done":
+        payload["download_url"] = url_for("main.export_job_download", job_id=job_id)
+    return jsonify(payload)
+
+
+@bp.get("/export/jobs/<job_id>/download")
+def export_job_download(job_id: str) -> Response:
+    job = jobs.get_job(job_id)
+    if job is None or job["status"] != "done" or not os.path.exists(job["path"]):
+        return jsonify({"error": "not ready"}), 404
+    params = json.loads(job["params"])
+    extension, mimetype = jobs.FORMATS[job["format"]]
+    download_name = _download_name(params.get("report", "records"), params["start"], params["end"], extension)
+    return send_file(job["path"], download_name=download_name, as_attachment=True, mimetype=mimetype, etag=job["key"])
+
+
+def _stream_report(encoder, mimetype: str, extension: str) -> Response:
+    filters = _export_filters()
+    report = _export_report()
+    chunks = encoder(*reports.report_table(report, filters))
+    headers = {"Content-Disposition": f"attachment; filename={_download_name(report, filters[0], filters[1], extension)}"}
+    if request.accept_encodings["gzip"]:
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
+
+@bp.get("/export/csv")
+def export_csv() -> Response:
+    return _stream_report(iter_csv, "text/csv", "csv")
+
+
+@bp.get("/export/ndjson")
+def export_ndjson() -> Response:
+    return _stream_report(iter_ndjson, "application/x-ndjson", "ndjson")
+
+
+@bp.get("/metrics")
+def metrics_page() -> Response:
+    # Counts live in each worker process and a scrape reaches whichever worker accepts it, so
+    # every series is labelled worker="<pid>"; sum without(worker) in queries for app totals.
+    # A restarted worker appears under a new pid and its old series go stale.
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 
 @bp.route("/manage", methods=["GET", "POST"]) 
@@ -199,19 +389,28 @@ def manage_students() -> str:
                 flash("الملف يجب أن يكون بصيغة Excel (.xlsx أو .xls)", "danger")
                 return redirect(url_for("main.manage_students"))
             try:
-                df = pd.read_excel(f)
+                import pandas as pd
+
+                df = pd.read_excel(f, dtype=str)
                 # Expect columns: الاسم, الرقم الامتحاني, المرحلة, الشعبة (optional), المختبر (optional)
-                students_list = []
-                for _, row in df.iterrows():
-                    students_list.append({
-                        "name": str(row.get("الاسم", "")),
-                        "exam_number": str(row.get("الرقم الامتحاني", "")),
-                        "stage": str(row.get("المرحلة", "")),
-                        "section": str(row.get("الشعبة", "")),
-                        "lab": str(row.get("المختبر", "")),
-                    })
-                added, errors = bulk_import_students(students_list)
-                flash(f"تم استيراد {added} طالب. {errors} خطأ." if errors else f"تم استيراد {added} طالب بنجاح.", "success" if not errors else "warning")
+                clean, errors = normalize_student_frame(df)
+                if request.form.get("mode") == "sync":
+                    result = sync_students(clean.to_dict("records"), report_removals=bool(request.form.get("report_removals")))
+                    added = result["added"]
+                    db_errors = result["errors"]
+                    flash(f"المزامنة: {result['added']} جديد، {result['updated']} محدّث، {result['unchanged']} بدون تغيير.", "success")
+                    if result["removed"]:
+                        shown = "، ".join(result["removed"][:IMPORT_ERRORS_SHOWN])
+                        flash(f"{len(result['removed'])} طالب غير موجود في الملف: {shown}", "info")
+                else:
+                    added, db_errors = bulk_import_students(clean.to_dict("records"))
+                errors = sorted(errors + db_errors, key=lambda e: e["row"])
+                if errors:
+                    flash(f"تم استيراد {added} طالب. {len(errors)} خطأ.", "warning")
+                    for e in errors[:IMPORT_ERRORS_SHOWN]:
+                        flash(f"الصف {e['row']} ({e['exam_number'] or '-'}): {e['error']}", "warning")
+                elif request.form.get("mode") != "sync":
+                    flash(f"تم استيراد {added} طالب بنجاح.", "success")
             except Exception as e:
                 flash(f"خطأ في قراءة الملف: {str(e)}", "danger")
             return redirect(url_for("main.manage_students"))
@@ -244,6 +443,6 @@ def manage_students() -> str:
     sections = []
     if q_stage:
         sections = get_sections_for_stage(q_stage)
-    return render_template("manage.html", students=students, stages=stages, sections=sections, filters={"name": q_name, "exam": q_exam, "stage": q_stage or "", "section": q_section or "", "lab": q_lab or ""})
+    return render_template("manage.html", students=students, stages=stages, sections=sections, labs=get_distinct_labs(defaults=DEFAULT_LABS), filters={"name": q_name, "exam": q_exam, "stage": q_stage or "", "section": q_section or "", "lab": q_lab or ""})
 
 
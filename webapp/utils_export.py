@@ -1,25 +1,34 @@
-from io import BytesIO
-from typing import Optional
+from __future__ import annotations
+
+import csv
+import json
+import math
+import multiprocessing
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from io import BytesIO, StringIO
+from tempfile import SpooledTemporaryFile
+from typing import IO, TYPE_CHECKING, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 import os
-import pandas as pd
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.lib.styles import ParagraphStyle
-from reportlab.lib.units import cm
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle, Spacer
-try:
-    import arabic_reshaper  # type: ignore
-    from bidi.algorithm import get_display  # type: ignore
-except Exception:
-    arabic_reshaper = None
-    get_display = None
+
+from . import metrics
+
+# pandas, reportlab, arabic_reshaper/bidi and pypdf are imported by the functions that
+# use them, so app workers start without loading them
+if TYPE_CHECKING:
+    import pandas as pd
+    from reportlab.platypus import SimpleDocTemplate
 
 
+@metrics.timed_library("pandas")
 def dataframe_to_excel_bytes(df: pd.DataFrame) -> bytes:
     """Export to Excel. Prefer XlsxWriter; fallback to OpenPyXL if unavailable."""
+    import pandas as pd
+
     output = BytesIO()
     # Try XlsxWriter first (best formatting support)
     try:
@@ -80,13 +89,113 @@ def dataframe_to_excel_bytes(df: pd.DataFrame) -> bytes:
         return output.getvalue()
 
 
+@metrics.timed_library("xlsxwriter")
+def rows_to_excel_file(columns: Sequence[str], rows: Iterable[Sequence[object]], spool_size: int = 8 * 1024 * 1024) -> IO[bytes]:
+    """
+    Stream rows into an .xlsx without holding them in memory.
+    XlsxWriter's constant_memory mode flushes each row as it is written and column
+    widths are tracked as rows go by. Returns a spooled temp file positioned at 0.
+    """
+    import xlsxwriter  # type: ignore
+
+    output = SpooledTemporaryFile(max_size=spool_size)
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True})
+    worksheet = workbook.add_worksheet("Attendance")
+    worksheet.right_to_left()
+
+    header_fmt = workbook.add_format({"bold": True, "align": "right", "font_name": "Arial"})
+    body_fmt = workbook.add_format({"font_name": "Arial", "align": "right"})
+    widths: List[int] = [len(str(c)) for c in columns]
+    for col_idx, col in enumerate(columns):
+        worksheet.write(0, col_idx, str(col), header_fmt)
+
+    for row_idx, row in enumerate(rows, start=1):
+        for col_idx, value in enumerate(row):
+            text = "" if value is None else str(value)
+            # Counts and rates stay numbers so they can be sorted, filtered and summed in Excel
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value):
+                worksheet.write_number(row_idx, col_idx, value, body_fmt)
+            else:
+                worksheet.write_string(row_idx, col_idx, text, body_fmt)
+            if len(text) > widths[col_idx]:
+                widths[col_idx] = len(text)
+
+    for idx, width in enumerate(widths):
+        worksheet.set_column(idx, idx, min(width + 2, 50), body_fmt)
+    workbook.close()
+    output.seek(0)
+    return output
+
+
+def iter_csv(columns: Sequence[str], rows: Iterable[Sequence[object]], batch_rows: int = 500) -> Iterator[bytes]:
+    """Encode rows as UTF-8 CSV, yielding the header first and then one chunk per batch."""
+    buf = StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    yield buf.getvalue().encode("utf-8")
+    buf.seek(0)
+    buf.truncate()
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= batch_rows:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+            pending = 0
+    if pending:
+        yield buf.getvalue().encode("utf-8")
+
+
+def iter_ndjson(columns: Sequence[str], rows: Iterable[Sequence[object]], batch_rows: int = 500) -> Iterator[bytes]:
+    """Encode rows as newline-delimited JSON objects keyed by column name."""
+    lines: List[str] = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+        if len(lines) >= batch_rows:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Compress a byte stream incrementally into a single gzip member."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# Set PDF_FONT_PATH to a TTF with Arabic glyphs to skip discovery (e.g. on Linux hosts)
+PDF_FONT_PATH = os.environ.get("PDF_FONT_PATH", "")
+SHAPE_CACHE_SIZE = int(os.environ.get("PDF_SHAPE_CACHE_SIZE", "8192"))
+
+_FONT_CANDIDATES = [
+    ("Tahoma", r"C:\\Windows\\Fonts\\tahoma.ttf"),
+    ("Arial", r"C:\\Windows\\Fonts\\arial.ttf"),
+    ("SegoeUI", r"C:\\Windows\\Fonts\\segoeui.ttf"),
+    ("NotoNaskhArabic", "/usr/share/fonts/truetype/noto/NotoNaskhArabic-Regular.ttf"),
+    ("NotoSansArabic", "/usr/share/fonts/truetype/noto/NotoSansArabic-Regular.ttf"),
+    ("DejaVuSans", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"),
+    ("DejaVuSans", "/usr/share/fonts/dejavu/DejaVuSans.ttf"),
+    ("FreeSans", "/usr/share/fonts/truetype/freefont/FreeSans.ttf"),
+    ("DejaVuSans", "DejaVuSans.ttf"),
+]
+
+
+@lru_cache(maxsize=None)
 def _ensure_arabic_font() -> str:
-    candidates = [
-        ("Tahoma", r"C:\\Windows\\Fonts\\tahoma.ttf"),
-        ("Arial", r"C:\\Windows\\Fonts\\arial.ttf"),
-        ("SegoeUI", r"C:\\Windows\\Fonts\\segoeui.ttf"),
-        ("DejaVuSans", "DejaVuSans.ttf"),
-    ]
+    """Find and register an Arabic-capable font once per process; returns its reportlab name."""
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    candidates = list(_FONT_CANDIDATES)
+    if PDF_FONT_PATH:
+        candidates.insert(0, (os.path.splitext(os.path.basename(PDF_FONT_PATH))[0], PDF_FONT_PATH))
     for name, path in candidates:
         try:
             if os.path.exists(path):
@@ -101,49 +210,263 @@ def _ensure_arabic_font() -> str:
         return "Helvetica"
 
 
+@lru_cache(maxsize=None)
+def _arabic_shaper() -> Optional[tuple]:
+    """(reshape, get_display) when arabic_reshaper and python-bidi are installed."""
+    try:
+        import arabic_reshaper  # type: ignore
+        from bidi.algorithm import get_display  # type: ignore
+    except Exception:
+        return None
+    return arabic_reshaper.reshape, get_display
+
+
+@lru_cache(maxsize=SHAPE_CACHE_SIZE)
+def _shape_cached(text: str) -> str:
+    reshape, get_display = _arabic_shaper()
+    try:
+        return get_display(reshape(text))
+    except Exception:
+        return text
+
+
 def _shape_arabic(text: str) -> str:
     if not text:
         return text
-    if arabic_reshaper and get_display:
-        try:
-            reshaped = arabic_reshaper.reshape(str(text))
-            return get_display(reshaped)
-        except Exception:
-            return str(text)
+    if _arabic_shaper():
+        # Report cells repeat heavily (stage, section, lab, subject, status), so cache by value
+        return _shape_cached(str(text))
     return str(text)
 
 
-def dataframe_to_pdf_bytes(df: pd.DataFrame, title: Optional[str] = None) -> bytes:
+# Large reports are laid out as fixed-size page blocks; above PDF_PARALLEL_MIN_ROWS the
+# blocks are rendered in a process pool and merged with pypdf (when installed).
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", "0")) or (os.cpu_count() or 1)
+PDF_PARALLEL_MIN_ROWS = int(os.environ.get("PDF_PARALLEL_MIN_ROWS", "5000"))
+_PDF_FONT_SIZE = 9
+_PDF_ROW_HEIGHT = 14
+_PDF_TITLE_HEIGHT = 20 + 0.3 * 72 / 2.54  # title leading plus its 0.3cm spacer, in points
+_PDF_CHAR_WIDTH = 0.6 * _PDF_FONT_SIZE  # about one digit or Latin letter, in points
+_PDF_CELL_PADDING = 12  # Table's default left plus right padding
+
+
+def _pdf_doc(buffer: IO[bytes]) -> SimpleDocTemplate:
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.lib.units import cm
+    from reportlab.platypus import SimpleDocTemplate
+
+    return SimpleDocTemplate(buffer, pagesize=landscape(A4), leftMargin=1*cm, rightMargin=1*cm, topMargin=1*cm, bottomMargin=1*cm)
+
+
+def _pdf_page_blocks(n_rows: int, with_title: bool) -> List[Tuple[int, int]]:
+    """Split row indexes into (start, end) blocks that each fill exactly one page."""
+    doc = _pdf_doc(BytesIO())
+    usable = doc.height - 12  # frame padding
+
+    def capacity(title: bool) -> int:
+        # minus the header row and one row of slack so a block never spills over
+        return int((usable - (_PDF_TITLE_HEIGHT if title else 0)) // _PDF_ROW_HEIGHT) - 2
+
+    blocks = [(0, min(capacity(with_title), n_rows))]
+    per_page = capacity(False)
+    while blocks[-1][1] < n_rows:
+        start = blocks[-1][1]
+        blocks.append((start, min(start + per_page, n_rows)))
+    return blocks
+
+
+def _pdf_column_weights(columns: Sequence[str], rows: List[List[str]]) -> List[int]:
+    """Each column's longest value (header included) in characters, clamped to 3..40."""
+    chars = [len(str(c)) for c in columns]
+    for row in rows:
+        for i, v in enumerate(row):
+            if len(v) > chars[i]:
+                chars[i] = len(v)
+    return [min(max(c, 3), 40) for c in chars]
+
+
+def _pdf_column_bands(weights: List[int], repeat_columns: int) -> List[List[int]]:
+    """
+    Column indexes printed on each band of pages. A table too wide for the page is
+    split: every band repeats the first repeat_columns columns and takes as many of
+    the others as fit beside them.
+    """
+    everything = [list(range(len(weights)))]
+    if not 0 < repeat_columns < len(weights):
+        return everything
+    width = _pdf_doc(BytesIO()).width
+    need = [w * _PDF_CHAR_WIDTH + _PDF_CELL_PADDING for w in weights]
+    if sum(need) <= width:
+        return everything
+    keys = list(range(repeat_columns))
+    bands: List[List[int]] = []
+    band: List[int] = []
+    used = sum(need[:repeat_columns])
+    for i in range(repeat_columns, len(weights)):
+        if band and used + need[i] > width:
+            bands.append(keys + band)
+            band, used = [], sum(need[:repeat_columns])
+        band.append(i)
+        used += need[i]
+    return bands + [keys + band]
+
+
+def _pdf_column_widths(weights: List[int], bands: List[List[int]]) -> List[List[float]]:
+    """Column widths of each band, sharing the page width by each column's weight."""
+    width = _pdf_doc(BytesIO()).width
+    return [[width * weights[i] / sum(weights[i] for i in band) for i in band] for band in bands]
+
+
+def _render_pdf_blocks(
+    columns: Sequence[str],
+    rows: List[List[str]],
+    blocks: List[Tuple[int, int, int]],
+    first_page: int,
+    total_pages: int,
+    title: Optional[str],
+    bands: List[List[int]],
+    col_widths: List[List[float]],
+) -> bytes:
+    """Lay out page blocks (column band, then indexes into rows) as PDF pages numbered from first_page."""
+    from reportlab.lib import colors
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.lib.units import cm
+    from reportlab.platypus import PageBreak, Paragraph, Spacer, Table, TableStyle
+
     buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=landscape(A4), leftMargin=1*cm, rightMargin=1*cm, topMargin=1*cm, bottomMargin=1*cm)
+    doc = _pdf_doc(buffer)
+    font_name = _ensure_arabic_font()
+    style = TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#f0f0f0")),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.black),
+        ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+        ("ALIGN", (0, 0), (-1, -1), "RIGHT"),
+        ("FONTNAME", (0, 0), (-1, -1), font_name),
+        ("FONTSIZE", (0, 0), (-1, -1), _PDF_FONT_SIZE),
+        ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#fafafa")]),
+    ])
+    headers = [_shape_arabic(str(c)) for c in columns]
+
     elements = []
+    for i, (band, start, end) in enumerate(blocks):
+        if first_page + i == 1 and title:
+            title_style = ParagraphStyle(name="Title", fontName=font_name, fontSize=16, leading=20, alignment=2)
+            elements.append(Paragraph(_shape_arabic(title), title_style))
+            elements.append(Spacer(1, 0.3*cm))
+        keep = bands[band]
+        data = [[headers[c] for c in keep]] + [[_shape_arabic(row[c]) for c in keep] for row in rows[start:end]]
+        table = Table(data, colWidths=col_widths[band], rowHeights=_PDF_ROW_HEIGHT)
+        table.setStyle(style)
+        elements.append(table)
+        if i < len(blocks) - 1:
+            elements.append(PageBreak())
 
-    font_name = _ensure_arabic_font()
-    title_style = ParagraphStyle(name="Title", fontName=font_name, fontSize=16, leading=20, alignment=2)
-    if title:
-        elements.append(Paragraph(_shape_arabic(title), title_style))
-        elements.append(Spacer(1, 0.3*cm))
-
-    headers = [ _shape_arabic(str(c)) for c in df.columns ]
-    rows = []
-    for row in df.values.tolist():
-        rows.append([ _shape_arabic(str(v)) for v in row ])
-    data = [headers] + rows
-    table = Table(data, repeatRows=1)
-    table.setStyle(
-        TableStyle([
-            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#f0f0f0")),
-            ("TEXTCOLOR", (0, 0), (-1, 0), colors.black),
-            ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
-            ("ALIGN", (0, 0), (-1, -1), "RIGHT"),
-            ("FONTNAME", (0, 0), (-1, -1), font_name),
-            ("FONTSIZE", (0, 0), (-1, -1), 9),
-            ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#fafafa")]),
-        ])
-    )
-    elements.append(table)
-
-    doc.build(elements)
+    def page_number(canvas, _doc) -> None:
+        canvas.saveState()
+        canvas.setFont(font_name, 8)
+        page = first_page + canvas.getPageNumber() - 1
+        canvas.drawCentredString(doc.pagesize[0] / 2, 0.5*cm, f"{page} / {total_pages}")
+        canvas.restoreState()
+
+    doc.build(elements, onFirstPage=page_number, onLaterPages=page_number)
     return buffer.getvalue()
 
 
+@lru_cache(maxsize=None)
+def _pypdf() -> Optional[tuple]:
+    """(PdfReader, PdfWriter) when pypdf is installed; needed only to merge parallel parts."""
+    try:
+        from pypdf import PdfReader, PdfWriter  # type: ignore
+    except Exception:
+        return None
+    return PdfReader, PdfWriter
+
+
+def _render_pdf_part(args: tuple) -> bytes:
+    return _render_pdf_blocks(*args)
+
+
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+_pdf_pool_pid: Optional[int] = None
+_pdf_pool_lock = threading.Lock()
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """
+    One PDF_WORKERS-sized pool per process, shared by concurrent exports. Its workers come
+    from a forkserver rather than fork(): the web process serves requests on several threads,
+    and a fork taken while one of them holds a lock (SQLite, logging) can leave the child
+    deadlocked.
+    """
+    global _pdf_pool, _pdf_pool_pid
+    with _pdf_pool_lock:
+        if _pdf_pool is None or _pdf_pool_pid != os.getpid():
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload([__name__])
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=context)
+            _pdf_pool_pid = os.getpid()
+        return _pdf_pool
+
+
+def _drop_pdf_pool(pool: ProcessPoolExecutor) -> None:
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is pool:
+            _pdf_pool = None
+    pool.shutdown(wait=False)
+
+
+@metrics.timed_library("reportlab")
+def rows_to_pdf_bytes(
+    columns: Sequence[str],
+    rows: Iterable[Sequence[object]],
+    title: Optional[str] = None,
+    workers: Optional[int] = None,
+    repeat_columns: int = 0,
+) -> bytes:
+    """
+    Render a report as a PDF with the header row repeated and continuous page numbers.
+    Each page is its own fixed-size table, so layout cost is linear in the row count.
+    With repeat_columns, a table too wide for the page is printed as bands of columns,
+    one after another, each starting with those leading columns.
+    """
+    data = [["" if v is None else str(v) for v in row] for row in rows]
+    weights = _pdf_column_weights(columns, data)
+    bands = _pdf_column_bands(weights, repeat_columns)
+    blocks = [
+        (band, start, end)
+        for band in range(len(bands))
+        for start, end in _pdf_page_blocks(len(data), bool(title) and band == 0)
+    ]
+    col_widths = _pdf_column_widths(weights, bands)
+    workers = min(workers or PDF_WORKERS, len(blocks))
+    if workers <= 1 or len(data) < PDF_PARALLEL_MIN_ROWS or _pypdf() is None:
+        return _render_pdf_blocks(columns, data, blocks, 1, len(blocks), title, bands, col_widths)
+    PdfReader, PdfWriter = _pypdf()
+
+    # Contiguous runs of pages per worker; each part numbers its pages from its offset
+    per_worker = -(-len(blocks) // workers)
+    tasks = []
+    for first in range(0, len(blocks), per_worker):
+        part = blocks[first:first + per_worker]
+        lo, hi = min(s for _, s, _ in part), max(e for _, _, e in part)
+        rebased = [(b, s - lo, e - lo) for b, s, e in part]
+        tasks.append((columns, data[lo:hi], rebased, first + 1, len(blocks), title, bands, col_widths))
+    pool = _get_pdf_pool()
+    try:
+        parts = list(pool.map(_render_pdf_part, tasks))
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory): start a fresh pool next time, render here now
+        _drop_pdf_pool(pool)
+        return _render_pdf_blocks(columns, data, blocks, 1, len(blocks), title, bands, col_widths)
+
+    writer = PdfWriter()
+    for part in parts:
+        writer.append(PdfReader(BytesIO(part)))
+    output = BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def dataframe_to_pdf_bytes(df: pd.DataFrame, title: Optional[str] = None) -> bytes:
+    return rows_to_pdf_bytes([str(c) for c in df.columns], df.astype(object).where(df.notna(), None).values.tolist(), title=title)
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, List, Tuple
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# Excel header -> students column
+IMPORT_COLUMNS = {
+    "الاسم": "name",
+    "الرقم الامتحاني": "exam_number",
+    "المرحلة": "stage",
+    "الشعبة": "section",
+    "المختبر": "lab",
+}
+REQUIRED_COLUMNS = ("name", "exam_number", "stage")
+
+
+def normalize_student_frame(df: pd.DataFrame) -> Tuple[pd.DataFrame, List[dict]]:
+    """
+    Clean an uploaded roster with column operations only.
+    Returns (valid rows, errors). Each row keeps its spreadsheet row number in "row";
+    each error is {"row", "exam_number", "error"}. Optional columns the sheet lacks are
+    left out, so a sync can tell them from blank cells.
+    """
+    import pandas as pd
+
+    df = df.rename(columns=lambda c: IMPORT_COLUMNS.get(str(c).strip(), str(c).strip()))
+    out = pd.DataFrame(index=df.index)
+    for col in IMPORT_COLUMNS.values():
+        if col in df.columns:
+            out[col] = df[col].fillna("").astype(str).str.strip()
+        elif col in REQUIRED_COLUMNS:
+            out[col] = ""
+    # Header is spreadsheet row 1, so data starts at row 2
+    out["row"] = out.index.to_numpy() + 2
+
+    errors: List[dict] = []
+    missing = (out[list(REQUIRED_COLUMNS)] == "").any(axis=1)
+    errors += _errors(out[missing], "الاسم والرقم الامتحاني والمرحلة حقول مطلوبة.")
+    out = out[~missing]
+
+    dup = out.duplicated("exam_number", keep="first")
+    errors += _errors(out[dup], "الرقم الامتحاني مكرر في الملف.")
+    out = out[~dup]
+    return out, errors
+
+
+def _errors(rows: pd.DataFrame, message: str) -> List[dict]:
+    return [
+        {"row": int(r), "exam_number": e, "error": message}
+        for r, e in zip(rows["row"].tolist(), rows["exam_number"].tolist())
+    ]
@@ -0,0 +1,121 @@
+import datetime
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from . import db, metrics
+
+
+logger = logging.getLogger(__name__)
+
+# GROUP_COMMIT=0 makes every request commit its own transaction on its own connection
+GROUP_COMMIT = os.environ.get("GROUP_COMMIT", "1") != "0"
+# How long the writer holds a transaction open for more writes to arrive. 0 only merges
+# what queued up while the previous commit ran, so a lone write is never delayed.
+GROUP_COMMIT_WAIT_MS = float(os.environ.get("GROUP_COMMIT_WAIT_MS", "0"))
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get("GROUP_COMMIT_MAX_BATCH", "64"))
+
+
+class GroupCommitWriter:
+    """
+    One thread that owns this process's attendance writes. Callers queue a write and wait
+    on its Future; the thread takes everything queued meanwhile (up to `max_batch`) and
+    applies it in one BEGIN IMMEDIATE transaction with a single commit, so concurrent roll
+    calls share one fsync instead of queueing for the SQLite write lock one by one. Each
+    write runs under its own savepoint, so one that raises is rolled back alone.
+    """
+
+    def __init__(self, max_batch: int = GROUP_COMMIT_MAX_BATCH, wait_ms: float = GROUP_COMMIT_WAIT_MS) -> None:
+        self.max_batch, self.wait = max(1, max_batch), wait_ms / 1000
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Queue fn(conn, *args); the Future resolves once its transaction has committed."""
+        future: Future = Future()
+        self._queue.put((fn, args, future, time.perf_counter()))
+        return future
+
+    def _next_batch(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            try:
+                self._commit(batch)
+            except Exception as exc:  # BEGIN or COMMIT failed: no write in the batch was saved
+                logger.exception("group commit of %d write(s) failed", len(batch))
+                for _, _, future, _ in batch:
+                    future.set_exception(exc)
+
+    def _commit(self, batch: List[tuple]) -> None:
+        conn = db.get_conn()
+        began = time.perf_counter()
+        for _, _, _, queued in batch:
+            metrics.GROUP_COMMIT_WAIT.observe(began - queued)
+        metrics.GROUP_COMMIT_BATCH.observe(len(batch))
+
+        outcomes = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for fn, args, future, _ in batch:
+                conn.execute("SAVEPOINT write")
+                try:
+                    outcomes.append((future, fn(conn, *args), None))
+                except Exception as exc:
+                    conn.execute("ROLLBACK TO write")
+                    outcomes.append((future, None, exc))
+                conn.execute("RELEASE write")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        # Only answer callers once their rows are committed
+        for future, result, exc in outcomes:
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+
+
+_writer: Optional[GroupCommitWriter] = None
+_writer_pid: Optional[int] = None
+_writer_lock = threading.Lock()
+
+
+def _get_writer() -> GroupCommitWriter:
+    # Threads do not survive fork, so each gunicorn worker starts its own writer
+    global _writer, _writer_pid
+    if _writer is None or _writer_pid != os.getpid():
+        with _writer_lock:
+            if _writer is None or _writer_pid != os.getpid():
+                _writer = GroupCommitWriter()
+                _writer_pid = os.getpid()
+    return _writer
+
+
+def upsert_attendance_bulk(
+    date: datetime.date,
+    entries: Iterable[Tuple[str, str]],
+    subject: str = "",
+) -> Tuple[int, List[Tuple[str, str]]]:
+    """db.upsert_attendance_bulk, routed through this process's group-commit writer."""
+    entries = list(entries)
+    # Corrections to an archived year attach its archive, which cannot happen in the batch's transaction
+    if not GROUP_COMMIT or not entries or db.archived_year(date) is not None:
+        return db.upsert_attendance_bulk(date, entries, subject)
+    return _get_writer().submit(db.apply_attendance_bulk, date, entries, subject).result()